@@ -0,0 +1,225 @@
+# Copyright 2014-2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import json
+import errno
+import hashlib
+import logging
+import zipfile
+import threading
+
+try:
+    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError, URLError
+except ImportError:
+    from urllib2 import urlopen, Request, HTTPError, URLError
+
+import pkg_resources
+
+from .util import write_bytes_if_changed
+from .targets import get_target_definitions
+
+logger = logging.getLogger('progen.cache')
+
+# default size of a local cache, MB
+DEFAULT_SIZE = 1024
+# seconds to wait for a remote cache
+HTTP_TIMEOUT = 10
+# entry member with the files reported by the exporter
+ENTRY_INFO = '.progen_entry.json'
+
+def get_version():
+    try:
+        return pkg_resources.require("project_generator")[0].version
+    except Exception:
+        return None
+
+def get_key(fingerprint, exporter):
+    """ Key of the generated files of a project by the exporter (class). The progen version
+    and the content of the target definitions are a part of it, exporters write mcu records
+    to the files. The working directory only if the exporter writes it (embeds_cwd) """
+    data = [fingerprint, get_version(), get_target_definitions().get_digest(),
+            os.getcwd() if exporter.embeds_cwd else None]
+    return hashlib.sha1(json.dumps(data).encode('utf-8')).hexdigest()
+
+def pack(output_dir, files, generated):
+    """ Entry of files within the output directory, None if some file is outside it """
+    names = []
+    stream = io.BytesIO()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for path in sorted(set(os.path.abspath(f) for f in files)):
+            name = os.path.relpath(path, output_dir)
+            if name.startswith(os.pardir):
+                logger.debug("%s is outside %s, not cached" % (path, output_dir))
+                return None
+            name = name.replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                archive.writestr(name, f.read())
+            names.append(name)
+        archive.writestr(ENTRY_INFO, json.dumps({'files': names, 'generated': generated}))
+    return stream.getvalue()
+
+def unpack(data, output_dir):
+    """ Writes files of the entry to the output directory, returns (files, generated) """
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        info = json.loads(archive.read(ENTRY_INFO).decode('utf-8'))
+        files = []
+        for name in info['files']:
+            path = os.path.normpath(os.path.join(output_dir, name))
+            if os.path.relpath(path, output_dir).startswith(os.pardir):
+                raise ValueError("%s is outside %s" % (name, output_dir))
+            write_bytes_if_changed(path, archive.read(name))
+            files.append(path)
+    return files, info['generated']
+
+# Cache backends store entries (bytes) by their key. A backend never fails generation,
+# an entry which can't be read is a miss.
+class Cache(object):
+    """Just a cache backend template for subclassing"""
+
+    def __init__(self, location):
+        self.location = location
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def put(self, key, data):
+        raise NotImplementedError
+
+    def get(self, key):
+        """ Returns the entry of the key, None if not stored """
+        data = self._get(key)
+        with self.lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def close(self):
+        pass
+
+    def summarize(self):
+        """ A line for the log """
+        return "Cache %s: %d hits, %d misses" % (self.location, self.hits, self.misses)
+
+class LocalCache(Cache):
+    """ Entries stored as files in a directory, which might be shared by several machines.
+
+    Used entries are touched, once the cache is closed the least recently used ones
+    are removed until the size is at most max_size bytes.
+    """
+
+    def __init__(self, path, max_size=DEFAULT_SIZE * 1024 * 1024):
+        Cache.__init__(self, path)
+        self.path = path
+        self.max_size = max_size
+
+    def _get_path(self, key):
+        return os.path.join(self.path, key[:2], key + '.zip')
+
+    def _get(self, key):
+        path = self._get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path, None)
+            return data
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                logger.warning("Cache entry %s can't be read: %s" % (path, e))
+            return None
+
+    def put(self, key, data):
+        try:
+            write_bytes_if_changed(self._get_path(key), data)
+        except (IOError, OSError) as e:
+            logger.warning("Cache entry %s can't be written: %s" % (key, e))
+
+    def close(self):
+        self.evict()
+
+    def evict(self):
+        """ Removes the least recently used entries above the size, returns their number """
+        entries = []
+        for root, dirs, names in os.walk(self.path):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        size = sum(entry[2] for entry in entries)
+        removed = 0
+        for mtime, path, entry_size in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+            size -= entry_size
+        if removed:
+            logger.debug("Removed %d entries from the cache %s" % (removed, self.path))
+        return removed
+
+class HttpCache(Cache):
+    """ Entries stored by a HTTP server as url/key, read by GET and stored by PUT.
+    The server is responsible for eviction """
+
+    def __init__(self, url):
+        Cache.__init__(self, url)
+        self.url = url.rstrip('/')
+
+    def _get(self, key):
+        try:
+            return urlopen('%s/%s' % (self.url, key), timeout=HTTP_TIMEOUT).read()
+        except HTTPError as e:
+            if e.code != 404:
+                logger.warning("Cache %s: %s" % (self.url, e))
+        except (URLError, IOError, OSError) as e:
+            logger.warning("Cache %s: %s" % (self.url, e))
+        return None
+
+    def put(self, key, data):
+        request = Request('%s/%s' % (self.url, key), data=data)
+        request.add_header('Content-Type', 'application/octet-stream')
+        request.get_method = lambda: 'PUT'
+        try:
+            urlopen(request, timeout=HTTP_TIMEOUT).read()
+        except (URLError, IOError, OSError) as e:
+            logger.warning("Cache %s: %s" % (self.url, e))
+
+# url scheme -> backend, paths are local caches
+CACHE_BACKENDS = {
+    'http': HttpCache,
+    'https': HttpCache,
+}
+
+def get_cache(location, max_size=DEFAULT_SIZE):
+    """ Cache backend for the location, a directory or url. max_size (MB) of a local cache """
+    scheme = location.split('://', 1)[0] if '://' in location else None
+    if scheme in CACHE_BACKENDS:
+        return CACHE_BACKENDS[scheme](location)
+    if scheme:
+        raise ValueError("Cache %s is not supported, use a directory or one of: %s" %
+                         (location, ", ".join(sorted(CACHE_BACKENDS.keys()))))
+    return LocalCache(os.path.expanduser(location), max_size * 1024 * 1024)
@@ -15,6 +15,12 @@
 import argparse
 from os.path import exists
 
+from ..tools_supported import ToolsSupported
+from ..util import uniqify
+
+# tool of generate and build if none is given, shards of all commands are computed for it
+DEFAULT_TOOL = 'gnu_mcu_eclipse'
+
 def argparse_filestring_type(string):
     if not exists(string):
         raise argparse.ArgumentTypeError("%s is not a file." % string)
@@ -26,3 +32,42 @@ def argparse_string_type(case_converter, prefer_hyphen=False):
         return lambda string: case_converter(string).replace("_","-")
     else:
         return lambda string: case_converter(string).replace("-","_")
+
+def argparse_shard_type(string):
+    """ Shard i/N, i from 1 to N, returns (i, N) """
+    try:
+        index, count = [int(value) for value in string.split("/")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("%s is not a shard, use i/N." % string)
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("Shard %s is out of range, i is from 1 to N." % string)
+    return index, count
+
+def argparse_jobs_type(string):
+    """ Number of parallel jobs, 0 for the number of CPUs """
+    try:
+        jobs = int(string)
+    except ValueError:
+        raise argparse.ArgumentTypeError("%s is not a number of jobs." % string)
+    if jobs < 0:
+        raise argparse.ArgumentTypeError("Number of jobs %s is negative, use 0 for the number of CPUs." % string)
+    return jobs
+
+def argparse_favor_type(string):
+    """ A dimension and its comma separated favors, dimension=a,b, returns (dimension, [a, b]) """
+    dimension, sep, favors = string.partition("=")
+    favors = uniqify([favor.strip() for favor in favors.split(",") if favor.strip()])
+    if not sep or not dimension.strip() or not favors:
+        raise argparse.ArgumentTypeError("%s is not a favor dimension, use dimension=favor,favor." % string)
+    return dimension.strip(), favors
+
+def argparse_tools_type(string):
+    """ A comma separated list of tools, returns the list """
+    tools = uniqify([tool.strip().lower().replace("-", "_") for tool in string.split(",") if tool.strip()])
+    if not tools:
+        raise argparse.ArgumentTypeError("No tool specified.")
+    for tool in tools:
+        if tool not in ToolsSupported.TOOLS_DICT and tool not in ToolsSupported.TOOLS_ALIAS:
+            raise argparse.ArgumentTypeError("invalid tool: '%s' (choose from %s)" % (tool,
+                ", ".join(sorted(list(ToolsSupported.TOOLS_DICT.keys()) + list(ToolsSupported.TOOLS_ALIAS.keys())))))
+    return tools
@@ -14,10 +14,14 @@
 import os
 import logging
 
-from ..tools_supported import ToolsSupported
 from ..generate import Generator
 from ..settings import ProjectSettings
-from . import argparse_filestring_type, argparse_string_type
+from ..util import COPY_MODES
+from ..parallel import generate_parallel
+from ..manifest import summarize
+from ..cache import get_cache, DEFAULT_SIZE
+from ..shard import get_shard
+from . import argparse_filestring_type, argparse_tools_type, argparse_shard_type, argparse_jobs_type, DEFAULT_TOOL
 
 help = 'Build a project'
 
@@ -25,14 +29,52 @@ help = 'Build a project'
 def run(args):
     # Export if we know how, otherwise return
     generator = Generator(args.file)
+    names = args.project
+    if args.shard:
+        if args.project:
+            logging.error("--shard and --project can't be combined.")
+            return -1
+        names = get_shard(generator, args.tool, *args.shard, durations=args.shard_durations)
+        logging.info("Shard %d/%d: %s" % (args.shard + (", ".join(names) or "no projects",)))
+        if not names:
+            return 0
+    if args.jobs != 1 and args.project:
+        logging.error("--project and --jobs can't be combined.")
+        return -1
+    if args.jobs != 1:
+        # root projects are independent, each one is generated and built by a worker
+        return generate_parallel(args.file, names or sorted(generator.projects_dict.get('projects', {}).keys()),
+                                 args.tool, args.jobs or None, True, (args.cache, args.cache_size),
+                                 copied=args.copy, copy=args.copy, copy_mode=args.copy_mode,
+                                 copy_checksum=args.copy_checksum, force=args.force)
+    cache = None
+    if args.cache:
+        try:
+            cache = get_cache(args.cache, args.cache_size)
+        except ValueError as e:
+            logging.error(str(e))
+            return -1
     build_failed = False
     export_failed = False
-    for project in generator.generate(args.project):
-        if project.generate(args.tool, args.copy) == -1:
-            export_failed = True
-        if project.build(args.tool) == -1:
-            build_failed = True
+    statuses = []
+    try:
+        for project in generator.generate(names, args.tool):
+            if project.generate(copied=args.copy, copy=args.copy, copy_mode=args.copy_mode,
+                                copy_checksum=args.copy_checksum, force=args.force, cache=cache) == -1:
+                export_failed = True
+            if project.status:
+                statuses.append(project.status)
+            if project.build() == -1:
+                build_failed = True
+    finally:
+        if cache:
+            cache.close()
 
+    generator.save_index()
+    if statuses:
+        logging.info(summarize(statuses))
+    if cache:
+        logging.info(cache.summarize())
     if build_failed or export_failed:
         return -1
     else:
@@ -45,7 +87,27 @@ def setup(subparser):
     subparser.add_argument(
         "-p", "--project", help="Name of the project to build", default = '')
     subparser.add_argument(
-        "-t", "--tool", help="Build a project files for provided tool",
-        type=argparse_string_type(str.lower, False), choices=list(ToolsSupported.TOOLS_DICT.keys()) + list(ToolsSupported.TOOLS_ALIAS.keys()))
+        "-t", "--tool", help="Build a project files for provided tools (comma separated)", default=DEFAULT_TOOL,
+        type=argparse_tools_type)
     subparser.add_argument(
         "-c", "--copy", action="store_true", help="Copy all files to the exported directory")
+    subparser.add_argument(
+        "--copy-mode", choices=COPY_MODES, default='copy',
+        help="How files are placed to the exported directory (copy mode)")
+    subparser.add_argument(
+        "--copy-checksum", action="store_true", help="Compare file content, not only size and mtime (copy mode)")
+    subparser.add_argument(
+        "--force", action="store_true", help="Generate projects even if they are unchanged")
+    subparser.add_argument(
+        "--cache", help="Directory or http(s) url of a cache of generated files, shared by workspaces")
+    subparser.add_argument(
+        "--cache-size", type=int, default=DEFAULT_SIZE, help="Size of a cache directory (MB)")
+    subparser.add_argument(
+        "-j", "--jobs", type=argparse_jobs_type, default=1,
+        help="Number of projects built in parallel (0 = number of CPUs)")
+    subparser.add_argument(
+        "--shard", type=argparse_shard_type,
+        help="Only root projects of the shard i/N, projects sharing a library are in the same shard")
+    subparser.add_argument(
+        "--shard-durations", metavar="FILE",
+        help="Index file shared by all shards with generation durations (a copy of an index of the progen cache directory), balances shards by them (file counts by default)")
@@ -14,22 +14,51 @@
 import os
 import logging
 
-from ..tools_supported import ToolsSupported
 from ..generate import Generator
-from . import argparse_filestring_type, argparse_string_type
+from ..tools_supported import ToolsSupported
+from ..manifest import clean_outputs
+from ..shard import get_shard
+from . import argparse_filestring_type, argparse_tools_type, argparse_shard_type, DEFAULT_TOOL
 
 help = 'Clean generated projects'
 
 
 def run(args):
     generator = Generator(args.file)
-    for project in generator.generate(args.project):
-        project.clean(args.tool)
+    names = [args.project]
+    if args.shard:
+        if args.project:
+            logging.error("--shard and --project can't be combined.")
+            return -1
+        # the same shards as generate and build with the tools
+        names = get_shard(generator, args.tool or [DEFAULT_TOOL], *args.shard, durations=args.shard_durations)
+        logging.info("Shard %d/%d: %s" % (args.shard + (", ".join(names) or "no projects",)))
+    for name in names:
+        outputs = []
+        for tool in args.tool or [None]:
+            # libraries other projects still require are kept
+            outputs.extend(generator.index.get_clean_dirs(name, tool) or [])
+        if outputs:
+            # manifests list generated files, no need to resolve the project
+            clean_outputs([path for project, tool, path in outputs])
+            for project, tool, path in outputs:
+                generator.index.remove(project, tool)
+        else:
+            # not in the index, generated before it was written, by any of the tools
+            for project in generator.generate(name, args.tool or sorted(ToolsSupported.TOOLS_DICT.keys())):
+                project.clean()
+    generator.save_index()
     return 0
 
 def setup(subparser):
     subparser.add_argument("-f", "--file", help="YAML projects file", default='projects.yaml', type=argparse_filestring_type)
-    subparser.add_argument("-p", "--project", required = True, help="Specify which project to be removed")
+    subparser.add_argument("-p", "--project", help="Specify which project to be removed (all by default)", default = '')
+    subparser.add_argument(
+        "-t", "--tool", help="Clean project files for provided tools (comma separated, all by default)",
+        type=argparse_tools_type)
+    subparser.add_argument(
+        "--shard", type=argparse_shard_type,
+        help="Only root projects of the shard i/N, projects sharing a library are in the same shard")
     subparser.add_argument(
-        "-t", "--tool", help="Clean project files for this tool",
-        type=argparse_string_type(str.lower, False), choices=list(ToolsSupported.TOOLS_DICT.keys()) + list(ToolsSupported.TOOLS_ALIAS.keys()))
+        "--shard-durations", metavar="FILE",
+        help="Index file shared by all shards with generation durations (a copy of an index of the progen cache directory), balances shards by them (file counts by default)")
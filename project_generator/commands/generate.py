@@ -14,24 +14,106 @@
 import os
 import logging
 
-from ..tools_supported import ToolsSupported
 from ..generate import Generator
-from . import argparse_filestring_type, argparse_string_type
+from ..util import COPY_MODES
+from ..sinks import ArchiveSink
+from ..manifest import summarize
+from ..cache import get_cache, DEFAULT_SIZE
+from ..parallel import generate_parallel
+from ..pipeline import generate_pipeline
+from ..shard import get_shard
+from . import argparse_filestring_type, argparse_tools_type, argparse_shard_type, argparse_favor_type, argparse_jobs_type, DEFAULT_TOOL
 
 help = 'Generate a project record'
 
 def run(args):
     generator = Generator(args.file)
+    names = args.project
+    if args.shard:
+        if args.project:
+            logging.error("--shard and --project can't be combined.")
+            return -1
+        names = get_shard(generator, args.tool, *args.shard, durations=args.shard_durations)
+        logging.info("Shard %d/%d: %s" % (args.shard + (", ".join(names) or "no projects",)))
+        if not names:
+            return 0
     build_failed = False
     export_failed = False
     generated = True
-    for project in generator.generate(args.project, args.tool):
-        generated = False
-        if project.generate(copied=args.copy, copy=args.copy) == -1:
-            export_failed = True
+    sink = None
+    if args.archive:
         if args.build:
-            if project.build() == -1:
-                build_failed = True
+            logging.error("Projects generated to an archive can't be built.")
+            return -1
+        if args.jobs != 1 or args.pipeline:
+            logging.error("Projects generated to an archive can't be generated in parallel.")
+            return -1
+        try:
+            sink = ArchiveSink(args.archive, generator.settings.root)
+        except ValueError as e:
+            logging.error(str(e))
+            return -1
+    elif args.jobs != 1 and args.pipeline:
+        logging.error("--pipeline and --jobs can't be combined.")
+        return -1
+    elif args.jobs != 1 and args.favor_matrix:
+        logging.error("--favor-matrix and --jobs can't be combined.")
+        return -1
+    elif args.jobs != 1 and args.project:
+        logging.error("--project and --jobs can't be combined.")
+        return -1
+    elif args.jobs != 1:
+        # root projects are independent, each one is generated by a worker
+        return generate_parallel(args.file, names or sorted(generator.projects_dict.get('projects', {}).keys()),
+                                 args.tool, args.jobs or None, args.build, (args.cache, args.cache_size),
+                                 copied=args.copy, copy=args.copy, copy_mode=args.copy_mode,
+                                 copy_checksum=args.copy_checksum, force=args.force)
+    cache = None
+    if args.cache:
+        try:
+            cache = get_cache(args.cache, args.cache_size)
+        except ValueError as e:
+            logging.error(str(e))
+            return -1
+    if args.favor_matrix:
+        try:
+            projects = generator.generate_matrix(names, args.tool, args.favor_matrix)
+        except NameError as e:
+            logging.error(str(e))
+            return -1
+    else:
+        projects = generator.generate(names, args.tool)
+    try:
+        if args.pipeline:
+            # projects are built once all of them are written
+            results = generate_pipeline(projects, copied=args.copy, copy=args.copy, copy_mode=args.copy_mode,
+                                        copy_checksum=args.copy_checksum, force=args.force, cache=cache)
+        else:
+            results = ((project, project.generate(copied=args.copy, copy=args.copy, copy_mode=args.copy_mode,
+                                                  copy_checksum=args.copy_checksum, sink=sink, force=args.force,
+                                                  cache=cache))
+                       for project in projects)
+        statuses = []
+        for project, result in results:
+            generated = False
+            if project.status:
+                statuses.append(project.status)
+            if result == -1:
+                export_failed = True
+            if args.build:
+                if project.build() == -1:
+                    build_failed = True
+    finally:
+        if sink:
+            sink.close()
+        if cache:
+            cache.close()
+    if not sink:
+        generator.save_index()
+    if statuses:
+        logging.info(summarize(statuses))
+    if cache:
+        logging.info(cache.summarize())
     if build_failed or export_failed or generated:
         return -1
     else:
@@ -43,9 +125,37 @@ def setup(subparser):
     subparser.add_argument(
         "-p", "--project", help="Project to be generated", default = '')
     subparser.add_argument(
-        "-t", "--tool", help="Create project files for provided tool", default='gnu_mcu_eclipse',
-        type=argparse_string_type(str.lower, False), choices=list(ToolsSupported.TOOLS_DICT.keys()) + list(ToolsSupported.TOOLS_ALIAS.keys()))
+        "-t", "--tool", help="Create project files for provided tools (comma separated)", default=DEFAULT_TOOL,
+        type=argparse_tools_type)
     subparser.add_argument(
         "-b", "--build", action="store_true", help="Build defined projects")
     subparser.add_argument(
         "-c", "--copy", action="store_true", help="Copy all files to the exported directory")
+    subparser.add_argument(
+        "--copy-mode", choices=COPY_MODES, default='copy',
+        help="How files are placed to the exported directory (copy mode)")
+    subparser.add_argument(
+        "--copy-checksum", action="store_true", help="Compare file content, not only size and mtime (copy mode)")
+    subparser.add_argument(
+        "--archive", help="Write generated files to an archive (.zip, .tar, .tar.gz, .tar.bz2, .tar.zst) instead of the disk")
+    subparser.add_argument(
+        "--force", action="store_true", help="Generate projects even if they are unchanged")
+    subparser.add_argument(
+        "--cache", help="Directory or http(s) url of a cache of generated files, shared by workspaces")
+    subparser.add_argument(
+        "--cache-size", type=int, default=DEFAULT_SIZE, help="Size of a cache directory (MB)")
+    subparser.add_argument(
+        "-j", "--jobs", type=argparse_jobs_type, default=1,
+        help="Number of projects generated in parallel (0 = number of CPUs)")
+    subparser.add_argument(
+        "--pipeline", action="store_true",
+        help="Resolve, expand and write projects in concurrent stages (one process)")
+    subparser.add_argument(
+        "--shard", type=argparse_shard_type,
+        help="Only root projects of the shard i/N, projects sharing a library are in the same shard")
+    subparser.add_argument(
+        "--shard-durations", metavar="FILE",
+        help="Index file shared by all shards with generation durations (a copy of an index of the progen cache directory), balances shards by them (file counts by default)")
+    subparser.add_argument(
+        "--favor-matrix", type=argparse_favor_type, nargs="+", metavar="DIMENSION=FAVORS",
+        help="Generate each combination of favors (dimension=a,b), export_dir should contain {dimension}")
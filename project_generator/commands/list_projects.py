@@ -13,11 +13,11 @@
 # limitations under the License.
 import os
 import logging
-from project_generator_definitions.definitions import ProGenTargets
 
 from ..tools_supported import ToolsSupported
 from ..generate import Generator
 from ..settings import ProjectSettings
+from ..targets import get_target_definitions
 from . import argparse_filestring_type
 
 help = 'List general progen data as projects, tools or targets'
@@ -38,7 +38,7 @@ def run(args):
     else:
         if args.section == 'targets':
             print("\nProgen supports the following targets:\n")
-            print("\n".join(ProGenTargets().get_targets()))
+            print("\n".join(get_target_definitions().get_targets()))
         elif args.section == 'tools':
             print("\nProgen supports the following tools:\n")
             print("\n".join(ToolsSupported().get_supported()))
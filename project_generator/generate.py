@@ -12,17 +12,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import yaml,os,copy,logging
+import itertools
+import threading
         
 from .settings import ProjectSettings
 from .util import fix_properties_in_context, merge_without_override
 from .project import Project
+from .manifest import ManifestIndex
+from .sinks import MemorySink
 
 class Generator:
     def __init__(self, source):
+        self.source = source
         self.basepath = os.path.dirname(source)
         if len(self.basepath) == 0:
             self.basepath = "."
         self.properties = [{}]
+        # (source, destination) portable files already copied by this generator, the lock
+        # guards them and the directory listings
+        self.materialized_portable = set()
+        self.lock = threading.Lock()
+        # generated output directories, used by clean
+        self.index = ManifestIndex(self.basepath)
+        # parsed module files and directory listings, shared by projects of all tools
+        self.modules = {}
+        self.dirs = {}
         try:
             with open(source, 'rt') as f:
                 self.projects_dict = yaml.load(f)
@@ -40,41 +54,95 @@ class Generator:
     
     def _generate_subproj(self, project):
         """ don't generate src project """
-        for k, sproj in project.sub_projects.items():
+        for k, sproj in sorted(project.sub_projects.items()):
             if sproj.project['type'].lower() != "src":
                 yield sproj
                 self._generate_subproj(sproj)
     
-    def generate(self, name='', tool='gnu_mcu_eclipse'):
-        found = False
-        if name != '':
-            # process project first, workspaces afterwards
-            if 'projects' in self.projects_dict:
-                if name in self.projects_dict['projects'].keys():
-                    found = True
-                    records = self.projects_dict['projects'][name]
-                    self.push_properties()
-                    project = Project(name, tool, records,  self.settings, self)
-                    self.pop_properties()
-                    yield project
-                    for sproj in self._generate_subproj(project):
-                        yield sproj
+    def generate(self, name='', tool='gnu_mcu_eclipse', favors=None):
+        """ Yields projects for the tool, tool can be a list of tools. Projects are resolved
+        for each tool in turn, module files and directories are read once for all of them.
+        name is a project, a list of projects or '' for all projects. favors override
+        favors of the projects """
+        if not 'projects' in self.projects_dict:
+            logging.error("You specified an invalid project name.")
+            return
+        if isinstance(name, (list, tuple)):
+            names = list(name)
+        elif name != '':
+            names = [name]
         else:
-            if 'projects' in self.projects_dict:
-                found = True
-                for name, records in sorted(self.projects_dict['projects'].items(),
-                                            key=lambda x: x[0]):
-                    if not records:
-                        records = {}
-                    self.push_properties()
-                    project = Project(name, tool, records, self.settings, self)
-                    self.pop_properties()
-                    yield project
-                    for sproj in self._generate_subproj(project):
-                        yield sproj
-
-        if not found:
+            names = sorted(self.projects_dict['projects'].keys())
+        if [n for n in names if n not in self.projects_dict['projects']]:
             logging.error("You specified an invalid project name.")
+            return
+        tools = tool if isinstance(tool, (list, tuple)) else [tool]
+        for tool in tools:
+            for project in self._generate_tool(names, tool, favors):
+                yield project
+
+    def generate_matrix(self, name='', tool='gnu_mcu_eclipse', matrix=()):
+        """ Returns a list of projects for each combination of favors, matrix is a list of
+        (dimension, [favors]). Each combination needs its own output directories,
+        export_dir should contain {dimension} of each dimension. All combinations
+        are checked before any project is returned """
+        dimensions = [dimension for dimension, favors in matrix]
+        outputs = {}
+        projects = []
+        for values in itertools.product(*[favors for dimension, favors in matrix]):
+            favors = dict(zip(dimensions, values))
+            for project in self.generate(name, tool, favors):
+                output_dir = os.path.normpath(project.outdir_path)
+                if outputs.setdefault(output_dir, values) != values:
+                    raise NameError("Favors %s and %s of project %s are both generated to %s, use {%s} in export_dir." %
+                        (", ".join(outputs[output_dir]), ", ".join(values), project.name, output_dir, "}, {".join(dimensions)))
+                projects.append(project)
+        return projects
+
+    def _generate_tool(self, names, tool, favors=None):
+        for name in names:
+            records = self.projects_dict['projects'][name]
+            if not records:
+                records = {}
+            if favors:
+                # projects of the combination only, records are shared by all of them
+                records = copy.deepcopy(records)
+                records['favors'] = dict(records.get('favors') or {}, **favors)
+            self.push_properties()
+            project = Project(name, tool, records, self.settings, self)
+            self.pop_properties()
+            yield project
+            for sproj in self._generate_subproj(project):
+                yield sproj
+
+    def load_module(self, path):
+        """ Returns a copy of the parsed module file, a file is parsed once per generator """
+        if path not in self.modules:
+            with open(path, 'rt') as f:
+                self.modules[path] = yaml.load(f)
+        return copy.deepcopy(self.modules[path])
+
+    def list_dir(self, path):
+        """ Sorted (name, is file) entries of a directory, a directory is listed once per generator """
+        # listings are cleared once portable files are copied, possibly by another thread
+        with self.lock:
+            entries = self.dirs.get(path)
+            if entries is None:
+                entries = [(name, os.path.isfile(os.path.join(path, name))) for name in sorted(os.listdir(path))]
+                self.dirs[path] = entries
+        return entries
+
+    def save_index(self):
+        self.index.save()
+
+    def render(self, name='', tool=None, copy=False):
+        """ Generates projects in memory, nothing is written to the disk, for the default
+        tool of settings if tool is not set. Returns a dictionary {path relative to the root: bytes}
+        of generated files """
+        sink = MemorySink(self.settings.root)
+        for project in self.generate(name, tool or self.settings.DEFAULT_TOOL):
+            project.generate(copied=copy, copy=copy, sink=sink)
+        return sink.files
 
     def push_properties(self):
         self.properties.append(copy.deepcopy(self.settings.properties))
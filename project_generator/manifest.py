@@ -0,0 +1,250 @@
+# Copyright 2014-2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import hashlib
+import logging
+
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+from .util import load_json, dump_json, write_file_if_changed, FileLock, LOCK_FILE
+from .settings import ProjectSettings
+
+logger = logging.getLogger('progen.manifest')
+
+# list of files and directories produced by generate, stored in the output directory
+MANIFEST_FILE = '.progen_manifest.json'
+# inputs of the generated project in make syntax, stored in the output directory
+DEPFILE = '.progen.d'
+# generated output directories for each project and tool, an index per directory of
+# projects files, stored in the progen cache directory
+INDEX_DIR = 'outputs'
+
+def read_manifest(output_dir):
+    return load_json(os.path.join(output_dir, MANIFEST_FILE), {})
+
+def _escape_make(path):
+    return path.replace('$', '$$').replace('#', '\\#').replace(' ', '\\ ')
+
+def write_depfile(output_dir, inputs):
+    """ Write the depfile of the output directory, the depfile itself is the target, it is
+    touched by each generate. Each input gets an empty rule (as by gcc -MP), make does not
+    fail if an input is removed. Paths are relative to the working directory """
+    path = os.path.join(output_dir, DEPFILE)
+    inputs = sorted(set(os.path.relpath(i) for i in inputs))
+    lines = ["%s:%s" % (_escape_make(os.path.relpath(path)), "".join(" \\\n " + _escape_make(i) for i in inputs))]
+    lines.extend("\n%s:" % _escape_make(i) for i in inputs)
+    write_file_if_changed(path, "\n".join(lines) + "\n")
+    os.utime(path, None)
+    return path
+
+# why a project was generated or skipped (Project.status)
+UNCHANGED = 'unchanged'
+STATUSES = [UNCHANGED, 'new', 'changed', 'missing files', 'forced', 'copied']
+
+def write_manifest(output_dir, project, tool, files, fingerprint=None, generated=None):
+    """ Write the manifest of the output directory. Directories containing the files
+    are recorded as well, only those inside the output directory. The fingerprint
+    of the project and files reported by the exporter are kept for the next run """
+    files = set(os.path.relpath(f, output_dir) for f in files)
+    files.update([MANIFEST_FILE, LOCK_FILE])
+    dirs = set(['.'])
+    for f in files:
+        d = os.path.dirname(f)
+        while d and not d.startswith(os.pardir):
+            dirs.add(d)
+            d = os.path.dirname(d)
+    manifest = {
+        'project': project,
+        'tool': tool,
+        'files': sorted(f for f in files if not f.startswith(os.pardir)),
+        'dirs': sorted(dirs),
+    }
+    if fingerprint:
+        manifest['fingerprint'] = fingerprint
+        manifest['generated'] = generated
+    dump_json(os.path.join(output_dir, MANIFEST_FILE), manifest)
+    return manifest
+
+def get_status(manifest, output_dir, fingerprint, force=False):
+    """ Returns UNCHANGED if the output directory was generated with the same fingerprint
+    and its files still exist, otherwise why the project is generated """
+    if force:
+        return 'forced'
+    if not fingerprint:
+        return 'copied'
+    if not manifest.get('fingerprint'):
+        return 'new'
+    if manifest['fingerprint'] != fingerprint:
+        return 'changed'
+    for f in manifest.get('files', []):
+        if f not in (MANIFEST_FILE, LOCK_FILE) and not os.path.exists(os.path.join(output_dir, f)):
+            return 'missing files'
+    return UNCHANGED
+
+def summarize(statuses):
+    """ A line for the log, how many projects were skipped and why the others were generated """
+    counts = dict((status, statuses.count(status)) for status in set(statuses))
+    generated = ["%d %s" % (counts[status], status) for status in STATUSES[1:] if status in counts]
+    return "%d of %d projects unchanged, skipped; generated: %s" % (
+        counts.get(UNCHANGED, 0), len(statuses), ", ".join(generated) or "none")
+
+class ManifestIndex:
+    """ Index of generated output directories (project -> tool -> record).
+
+    Each record contains the path to the output directory relative to basepath,
+    the required projects generated together with the project and how long the
+    generation took (seconds). Changes are
+    merged into the index file when saved, other processes might update it too.
+    The index file is kept out of the source tree, in the cache directory.
+    """
+
+    def __init__(self, basepath, cache_dir=None):
+        self.basepath = basepath
+        name = os.path.realpath(basepath)
+        if not isinstance(name, bytes):
+            name = name.encode('utf-8')
+        self.path = os.path.join(cache_dir or ProjectSettings.CACHE_DIR, INDEX_DIR,
+                                 hashlib.sha1(name).hexdigest() + '.json')
+        self.data = load_json(self.path, {})
+        # (project, tool) -> record, None if removed
+        self.changes = {}
+
+    @property
+    def dirty(self):
+        return bool(self.changes)
+
+    def _set(self, data, project, tool, record):
+        if record is not None:
+            data.setdefault(project, {})[tool] = record
+        elif tool in data.get(project, {}):
+            del data[project][tool]
+            if not data[project]:
+                del data[project]
+
+    def add(self, project, tool, output_dir, required=(), duration=None):
+        record = {
+            'path': os.path.relpath(output_dir, self.basepath),
+            'required': sorted(required),
+        }
+        if duration is not None:
+            record['duration'] = round(duration, 3)
+        if self.data.get(project, {}).get(tool) != record:
+            self._set(self.data, project, tool, record)
+            self.changes[(project, tool)] = record
+
+    def remove(self, project, tool):
+        if tool in self.data.get(project, {}):
+            self._set(self.data, project, tool, None)
+            self.changes[(project, tool)] = None
+
+    def get_duration(self, project, tool):
+        """ Seconds the last generation of the project took, None if not recorded """
+        return self.data.get(project, {}).get(tool, {}).get('duration')
+
+    def get_output_dirs(self, project='', tool=None):
+        """ Returns list of (project, tool, output dir) for the project and its required projects
+        (all projects if not specified), None if the project was not generated """
+        if project and project not in self.data:
+            return None
+        outputs = []
+        visited = set()
+        projects = [project] if project else sorted(self.data.keys())
+        while projects:
+            name = projects.pop(0)
+            for record_tool, record in sorted(self.data.get(name, {}).items()):
+                if tool and record_tool != tool:
+                    continue
+                if (name, record_tool) in visited:
+                    continue
+                visited.add((name, record_tool))
+                outputs.append((name, record_tool, os.path.normpath(os.path.join(self.basepath, record['path']))))
+                projects.extend(record['required'])
+        return outputs
+
+    def get_clean_dirs(self, project='', tool=None):
+        """ Output dirs to clean for the project, as get_output_dirs. Required projects are
+        left out if any other project in the index still requires them """
+        outputs = self.get_output_dirs(project, tool)
+        if not project or not outputs:
+            return outputs
+        cleaned = set((name, record_tool) for name, record_tool, path in outputs)
+        kept = set()
+        for name in sorted(self.data.keys()):
+            for record_tool in sorted(self.data[name].keys()):
+                if (name, record_tool) not in cleaned:
+                    kept.update((required, required_tool) for required, required_tool, path
+                                in self.get_output_dirs(name, record_tool))
+        return [output for output in outputs if output[0] == project or output[:2] not in kept]
+
+    def save(self):
+        if not self.changes:
+            return
+        lock = FileLock(os.path.dirname(self.path), os.path.basename(self.path) + '.lock')
+        with lock:
+            data = load_json(self.path, {})
+            for (project, tool), record in self.changes.items():
+                self._set(data, project, tool, record)
+            # all outputs cleaned
+            if data:
+                dump_json(self.path, data)
+            else:
+                _remove_file(self.path)
+        # as in clean_outputs, a process which got the lock of the removed file takes a new one
+        _remove_file(lock.path)
+        self.data = data
+        self.changes = {}
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+        return 1
+    except OSError:
+        return 0
+
+def clean_outputs(output_dirs, jobs=None):
+    """ Remove files and directories listed in manifests of output directories.
+    Files not produced by progen are kept, as well as directories containing them.
+
+    Files of a directory are removed while its lock is held, a process generating to
+    the directory waits. The lock file is removed once released, a process which got
+    the lock of the removed file takes a new one (see FileLock).
+    """
+    removed = 0
+    pool = ThreadPool(jobs or cpu_count())
+    try:
+        for output_dir in output_dirs:
+            if not read_manifest(output_dir):
+                logger.debug("No manifest in %s, nothing to clean" % output_dir)
+                continue
+            logger.info("Cleaning directory %s" % output_dir)
+            # wait for a process generating to the directory
+            with FileLock(output_dir):
+                manifest = read_manifest(output_dir)
+                files = [os.path.join(output_dir, f) for f in manifest.get('files', []) if f != LOCK_FILE]
+                removed += sum(pool.map(_remove_file, files, chunksize=64))
+            if LOCK_FILE in manifest.get('files', []):
+                removed += _remove_file(os.path.join(output_dir, LOCK_FILE))
+            # deepest directories first
+            dirs = set(os.path.normpath(os.path.join(output_dir, d)) for d in manifest.get('dirs', []))
+            for d in sorted(dirs, key=lambda d: d.count(os.sep), reverse=True):
+                try:
+                    os.rmdir(d)
+                except OSError:
+                    pass
+    finally:
+        pool.close()
+        pool.join()
+    return removed
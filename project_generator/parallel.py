@@ -0,0 +1,127 @@
+# Copyright 2014-2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import logging
+import traceback
+
+from io import StringIO
+from multiprocessing import Pool, cpu_count
+
+from .generate import Generator
+from .manifest import summarize
+from .cache import get_cache
+
+logger = logging.getLogger('progen.parallel')
+
+# same as set by main
+LOG_FORMAT = "%(name)s %(levelname)s\t%(message)s"
+
+def estimate_cost(generator, name):
+    """ Estimated size of the project, size of its module file (the bigger, the more files it lists) """
+    try:
+        return os.path.getsize(os.path.join(generator.basepath, name, 'module.yaml'))
+    except OSError:
+        return 0
+
+class _TextStream(StringIO):
+    # logging in python 2 writes byte strings
+    def write(self, text):
+        if isinstance(text, bytes):
+            text = text.decode('utf-8', 'replace')
+        return StringIO.write(self, text)
+
+def _run_task(task):
+    """ Generates (and builds) a root project with its required projects in a worker.
+    Returns (name, result, log, statuses, (cache hits, misses)), log are records of the project
+    formatted as by main """
+    source, name, tool, options, build, cache, log_level = task
+    stream = _TextStream()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root_logger = logging.getLogger()
+    root_logger.handlers = [handler]
+    root_logger.setLevel(log_level)
+    result = 0
+    statuses = []
+    if cache[0]:
+        # entries are evicted by the parent, once all workers are done
+        cache = options['cache'] = get_cache(*cache)
+    try:
+        generator = Generator(source)
+        generated = False
+        for project in generator.generate(name, tool):
+            generated = True
+            if project.generate(**options) == -1:
+                result = -1
+            if project.status:
+                statuses.append(project.status)
+            if build and project.build() == -1:
+                result = -1
+        generator.save_index()
+        if not generated:
+            result = -1
+    except Exception:
+        logging.error("Generating %s failed\n%s" % (name, traceback.format_exc()))
+        result = -1
+    finally:
+        root_logger.handlers = []
+    stats = (cache.hits, cache.misses) if options.get('cache') else (0, 0)
+    return name, result, stream.getvalue(), statuses, stats
+
+def generate_parallel(source, names, tool, jobs=None, build=False, cache=(None, None), **options):
+    """ Generates root projects in a pool of processes, each worker with its own Generator.
+
+    The largest projects are started first. Log records of a project are printed together
+    once the project is done. cache is (location, size) of a cache (see cache.get_cache),
+    options are passed to Project.generate. Returns -1 if any project failed, 0 otherwise.
+    """
+    generator = Generator(source)
+    if not names:
+        logging.error("You specified an invalid project name.")
+        return -1
+    try:
+        parent_cache = get_cache(*cache) if cache[0] else None
+    except ValueError as e:
+        logging.error(str(e))
+        return -1
+    names = sorted(names, key=lambda name: (-estimate_cost(generator, name), name))
+    tasks = [(source, name, tool, options, build, cache, logging.getLogger().getEffectiveLevel()) for name in names]
+
+    result = 0
+    statuses = []
+    pool = Pool(min(jobs or cpu_count(), len(tasks)))
+    try:
+        for name, project_result, log, project_statuses, stats in pool.imap_unordered(_run_task, tasks):
+            statuses.extend(project_statuses)
+            if parent_cache:
+                parent_cache.hits += stats[0]
+                parent_cache.misses += stats[1]
+            if log:
+                sys.stderr.write(log)
+                sys.stderr.flush()
+            if project_result == -1:
+                logger.error("Project %s failed" % name)
+                result = -1
+    finally:
+        pool.close()
+        pool.join()
+        if parent_cache:
+            parent_cache.close()
+    if statuses:
+        logging.info(summarize(statuses))
+    if parent_cache:
+        logging.info(parent_cache.summarize())
+    return result
@@ -0,0 +1,120 @@
+# Copyright 2014-2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import logging
+import threading
+import traceback
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+logger = logging.getLogger('progen.pipeline')
+
+# projects waiting for the next stage, resolution does not run too far ahead
+QUEUE_SIZE = 4
+# threads rendering and writing projects
+WRITERS = 2
+
+_DONE = None
+
+if sys.version_info[0] < 3:
+    # the python 3 syntax, with_traceback, does not exist in python 2
+    exec("def _reraise(exc_info):\n    raise exc_info[0], exc_info[1], exc_info[2]\n")
+else:
+    def _reraise(exc_info):
+        raise exc_info[1].with_traceback(exc_info[2])
+
+class _Failure(object):
+    """ The first exception raised by a stage, the other stages stop """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.exc_info = None
+
+    def set(self, project):
+        logger.debug("Generating %s failed\n%s" % (project.name, traceback.format_exc()))
+        if not self.event.is_set():
+            self.exc_info = sys.exc_info()
+            self.event.set()
+
+    def is_set(self):
+        return self.event.is_set()
+
+def _expand(projects, expanded, failure, copied):
+    while True:
+        item = projects.get()
+        if item is _DONE:
+            break
+        index, project = item
+        if failure.is_set():
+            continue
+        try:
+            project.expand(copied)
+        except Exception:
+            failure.set(project)
+            continue
+        expanded.put(item)
+    for i in range(WRITERS):
+        expanded.put(_DONE)
+
+def _write(expanded, results, failure, options):
+    while True:
+        item = expanded.get()
+        if item is _DONE:
+            break
+        index, project = item
+        if failure.is_set():
+            continue
+        try:
+            results[index] = project.write(**options)
+        except Exception:
+            failure.set(project)
+
+def generate_pipeline(projects, copied=False, **options):
+    """ Generates projects in stages connected by bounded queues.
+
+    projects, an iterable such as Generator.generate, are resolved in this thread,
+    while files of the previous project are expanded (stat and listdir) by another
+    thread and the ones before are rendered and written by writer threads. options are passed to Project.write. Returns a list
+    of (project, result) in the order projects were resolved. The first exception
+    raised by a stage stops the pipeline and is raised again here.
+    """
+    resolving = projects
+    projects = queue.Queue(QUEUE_SIZE)
+    expanded = queue.Queue(QUEUE_SIZE)
+    resolved = []
+    results = {}
+    failure = _Failure()
+    threads = [threading.Thread(target=_expand, args=(projects, expanded, failure, copied))]
+    threads += [threading.Thread(target=_write, args=(expanded, results, failure, options)) for i in range(WRITERS)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        for project in resolving:
+            if failure.is_set():
+                break
+            projects.put((len(resolved), project))
+            resolved.append(project)
+    finally:
+        projects.put(_DONE)
+        for thread in threads:
+            thread.join()
+    if failure.exc_info:
+        # with the traceback of the stage
+        _reraise(failure.exc_info)
+    return [(project, results.get(index, -1)) for index, project in enumerate(resolved)]
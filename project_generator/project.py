@@ -13,16 +13,22 @@
 # limitations under the License.
 
 import os
+import time
 import shutil
 import logging
 import operator
 import copy
 import yaml
-# import json
+import json
+import hashlib
 
 from .tools_supported import ToolsSupported
-from .tools.tool import get_tool_template
-from .util import merge_recursive, PartialFormatter, FILES_EXTENSIONS, VALID_EXTENSIONS, FILE_MAP, copytree, fix_paths, merge_without_override, fix_properties_in_context
+from .tools.tool import get_tool_template, get_exporter_digest
+from .targets import get_target_definitions
+from .util import merge_recursive, PartialFormatter, FILES_EXTENSIONS, VALID_EXTENSIONS, FILE_MAP, copy_portable_files, fix_paths, merge_without_override, fix_properties_in_context, SYNC_STATE_FILE, FileLock, LOCK_FILE, file_digest
+from .manifest import write_manifest, read_manifest, clean_outputs, get_status, write_depfile, UNCHANGED, DEPFILE
+from .sinks import FileSink
+from .cache import get_key, get_version, pack, unpack
 
 logger = logging.getLogger('progen.project')
 
@@ -153,6 +159,7 @@ class Project:
         self.name = name
         self.tool = tool
         self.parent = parent
+        self.gen = gen
         self.basepath = os.path.sep.join([gen.basepath, name])
         self.portable_dirs = []
         if 'favors' in project_dicts:
@@ -163,52 +170,57 @@ class Project:
             gen.merge_properties_without_override(project_dicts['properties'])
             
         self.project = ProjectTemplate.get_project_template(self.name)
-        
+        # module files and portable sources read when the project was resolved
+        self.inputs = set()
+        # directories listed when the project was expanded
+        self.listed_dirs = set()
+
         try:
-            with open(os.path.sep.join([self.basepath, "module.yaml"]), 'rt') as f:
-                self.src_dicts = yaml.load(f)
-                if 'tool_specific' in self.src_dicts:
-                    for tool in self.src_dicts['tool_specific']:
-                        if tool in tool_keywords:
-                            for key in self.src_dicts['tool_specific'][tool]:
-                                if key == 'properties':
-                                    gen.merge_properties_without_override(self.src_dicts['tool_specific'][tool]['properties'])
-                                elif key == 'files' :
-                                    # files need careful merge
-                                    for ikey in self.src_dicts['tool_specific'][tool][key]:
-                                        self._process_files_item(ikey, self.src_dicts['tool_specific'][tool])
-                                elif key in self.project:
-                                    self.project[key] = Project._dict_elim_none(
-                                        merge_recursive(self.project[key], self.src_dicts['tool_specific'][tool][key]))
-
-                if 'favors' in self.src_dicts:
-                    for key in self.src_dicts['favors']:
-                        if key not in self.favors:
-                            self.favors[key] = self.src_dicts['favors'][key]
-
-                if 'properties' in self.src_dicts:
-                    gen.merge_properties_without_override(self.src_dicts['properties'])
-                if 'favor_dimensions' in self.src_dicts:
-                    #process favor context
-                    for dim in self.src_dicts['favor_dimensions']:
-                        if dim not in self.favors:
-                            raise NameError ("%s in favor_dimensions not set for project %s." % (dim, name))
-                        else:
-                            favor = self.src_dicts['project_favors'][self.favors[dim]]
-                            if favor['dimension'] != dim :
-                                raise NameError ("project_favors %s's dimension:%s, is not %s." %
-                                                 (self.favors[dim], favor['dimension'], dim))
-                            for key in favor :
-                                if key == 'properties':
-                                    gen.merge_properties_without_override(favor['properties'])
-                                elif key == 'dimension':
-                                    pass
-                                elif key == 'files' :
-                                    # files need careful merge
-                                    for ikey in favor[key]:
-                                        self._process_files_item(ikey, favor)
-                                elif key in self.project:
-                                    self.project[key] = Project._dict_elim_none(merge_recursive(self.project[key], favor[key]))
+            module_path = os.path.sep.join([self.basepath, "module.yaml"])
+            self.src_dicts = gen.load_module(module_path)
+            self.inputs.add(module_path)
+            if 'tool_specific' in self.src_dicts:
+                for tool in self.src_dicts['tool_specific']:
+                    if tool in tool_keywords:
+                        for key in self.src_dicts['tool_specific'][tool]:
+                            if key == 'properties':
+                                gen.merge_properties_without_override(self.src_dicts['tool_specific'][tool]['properties'])
+                            elif key == 'files' :
+                                # files need careful merge
+                                for ikey in self.src_dicts['tool_specific'][tool][key]:
+                                    self._process_files_item(ikey, self.src_dicts['tool_specific'][tool])
+                            elif key in self.project:
+                                self.project[key] = Project._dict_elim_none(
+                                    merge_recursive(self.project[key], self.src_dicts['tool_specific'][tool][key]))
+
+            if 'favors' in self.src_dicts:
+                for key in self.src_dicts['favors']:
+                    if key not in self.favors:
+                        self.favors[key] = self.src_dicts['favors'][key]
+
+            if 'properties' in self.src_dicts:
+                gen.merge_properties_without_override(self.src_dicts['properties'])
+            if 'favor_dimensions' in self.src_dicts:
+                #process favor context
+                for dim in self.src_dicts['favor_dimensions']:
+                    if dim not in self.favors:
+                        raise NameError ("%s in favor_dimensions not set for project %s." % (dim, name))
+                    else:
+                        favor = self.src_dicts['project_favors'][self.favors[dim]]
+                        if favor['dimension'] != dim :
+                            raise NameError ("project_favors %s's dimension:%s, is not %s." %
+                                             (self.favors[dim], favor['dimension'], dim))
+                        for key in favor :
+                            if key == 'properties':
+                                gen.merge_properties_without_override(favor['properties'])
+                            elif key == 'dimension':
+                                pass
+                            elif key == 'files' :
+                                # files need careful merge
+                                for ikey in favor[key]:
+                                    self._process_files_item(ikey, favor)
+                            elif key in self.project:
+                                self.project[key] = Project._dict_elim_none(merge_recursive(self.project[key], favor[key]))
         except IOError:
             raise IOError("The module.yaml in project:%s doesn't exist." % self.name)
 
@@ -216,8 +228,8 @@ class Project:
         self.project['type'] = self.project['type'].lower()
         self.project = fix_properties_in_context(self.project, settings.properties)
         
-        # always copy portable file to destionation
-        self._copy_portable_to_destination()
+        # portable files are materialized when the project is generated
+        self._plan_portable_files()
         self.outdir_path = self._get_output_dir_path(self.tool)
                 
         if self.project['type'] != 'exe':
@@ -228,7 +240,7 @@ class Project:
         
         #Process required project
         self.sub_projects = {}
-        for subproj in self.project['required']:                        
+        for subproj in sorted(self.project['required']):
             if self.project['required'][subproj]:
                 merge_without_override(self.project['required'][subproj], project_dicts)
             else:
@@ -241,6 +253,10 @@ class Project:
             self._inherit_parent_flags_and_macros(self.sub_projects[subproj])
                         
         self.generated_files = {}
+        # seconds spent by expand, recorded in the index with the write time
+        self.expand_time = 0
+        # why the project was generated or skipped by write (manifest.STATUSES)
+        self.status = None
     
     def _inherit_parent_flags_and_macros(self, subproj):
         for key in ['common', 'asm', 'c', 'cxx']:
@@ -374,7 +390,7 @@ class Project:
         # If it's dic add it , if file, add it to files
         use_includes = []
         if type(files) == dict:
-            for group_name, include_files in files.items():
+            for group_name, include_files in sorted(files.items(), key=lambda t: t[0]):
                 self._process_include_files(include_files, group_name)
         elif type(files) == list:
             use_includes = files
@@ -398,8 +414,9 @@ class Project:
                     # get all files from dir
                     include_files = []
                     try:
-                        for f in os.listdir(dir_path):
-                            if os.path.isfile(os.path.join(os.path.normpath(dir_path), f)) and f.split('.')[-1].lower() in FILES_EXTENSIONS['include_files']:
+                        self.listed_dirs.add(dir_path)
+                        for f, is_file in self.gen.list_dir(dir_path):
+                            if is_file and f.split('.')[-1].lower() in FILES_EXTENSIONS['include_files']:
                                 include_files.append(os.path.join(os.path.normpath(dir_path), f))
                     except:
                         # TODO: catch only those exceptions which are relevant
@@ -416,7 +433,7 @@ class Project:
     def _process_source_files(self, files, use_group_name='default', add_basepath = True):
         use_sources = []
         if type(files) == dict:
-            for group_name, sources in files.items():
+            for group_name, sources in sorted(files.items(), key=lambda t: t[0]):
                 # process each group name as separate entity
                 self._process_source_files(Project._list_elim_none(sources), group_name)
         elif type(files) == list:
@@ -432,8 +449,9 @@ class Project:
                 source_file = os.path.normpath(os.path.join(self.basepath, source_file))
             if os.path.isdir(source_file):
                 self.export['source_paths'].append(source_file)
-                self._process_source_files([os.path.join(source_file, f) for f in os.listdir(
-                    source_file) if os.path.isfile(os.path.join(source_file, f))], use_group_name, False)
+                self.listed_dirs.add(source_file)
+                self._process_source_files([os.path.join(source_file, f) for f, is_file in self.gen.list_dir(
+                    source_file) if is_file], use_group_name, False)
 
             # Based on the extension, create a groups inside source_files_(extension)
             extension = source_file.split('.')[-1].lower()
@@ -466,11 +484,13 @@ class Project:
             else:
                 location_format = self.settings.export_location_format
 
-        # substitute all of the different dynamic values
-        location = PartialFormatter().format(location_format, **{
+        # substitute all of the different dynamic values, favors as {dimension}
+        values = dict(self.favors)
+        values.update({
             'project_name': self.name,
             'tool': tool,
         })
+        location = PartialFormatter().format(location_format, **values)
         return location
 
     def _get_tool_keywords(self, tool):
@@ -485,6 +505,7 @@ class Project:
 
         # Set the template keys an get the relative path to fix all paths
         self.export = get_tool_template()
+        self.listed_dirs = set()
 
         location = self._get_output_dir_path(self.tool)
         self.export['output_dir']['path'] = os.path.normpath(location)
@@ -543,8 +564,13 @@ class Project:
         if self.export['output_type'] != 'src' and len(self.export['linker']['script_files']) == 0 :
             logger.debug("Executable - no linker command found.")
 
-    def _copy_sources_to_generated_destination(self):
-        """ Copies all project files to specified directory - generated dir """
+    def _copy_sources_to_generated_destination(self, mode='copy', checksum=False, sink=None):
+        """ Copies all project files to specified directory - generated dir
+
+        The copy is incremental, unchanged files are skipped and files which are
+        not part of the project anymore are removed (see util.sync_files)
+        """
+        sink = sink or FileSink()
 
         files = []
         for key in FILES_EXTENSIONS.keys():
@@ -558,100 +584,190 @@ class Project:
                     files.append(self.export[key])
 
         destination = os.path.join(self.settings.root, self.export['output_dir']['path'])
-        if os.path.exists(destination):
-            shutil.rmtree(destination)
+        pairs = []
         for item in files:
-            s = os.path.join(self.settings.root, self.basepath, item)
-            d = os.path.join(destination, item)
+            s = os.path.join(self.settings.root, item)
             if os.path.isdir(s):
-                shutil.copytree(s,d)
+                for dirpath, dirnames, filenames in os.walk(s):
+                    for name in filenames:
+                        path = os.path.join(dirpath, name)
+                        pairs.append((path, os.path.join(item, os.path.relpath(path, s))))
+            elif os.path.isfile(s):
+                pairs.append((s, item))
             else:
-                if not os.path.exists(os.path.dirname(d)):
-                    os.makedirs(os.path.join(self.settings.root, os.path.dirname(d)))
-                shutil.copy2(s,d)
-    
-    def _ignore_source_files(self, s_cfg_path, d_cfg_path, src, names):
-        ignore_names = []
-        for name in names:
-            if os.path.splitext(name)[1] in [".h", ".hpp", "inc"]:
-                d_cfg_file = os.path.normpath(os.path.join(d_cfg_path, os.path.relpath(s_cfg_path, src), name))
-                self.project['files']['includes'].setdefault(self._get_portable_group(), []).append(os.path.relpath(d_cfg_file, self.basepath))
-            else:
-                ignore_names.append(name)                
-        return ignore_names
-    
-    def _ignore_header_files(self, s_port_path, d_port_path, src, names):
-        ignore_names = []
-        for name in names:
-            if os.path.splitext(name)[1] in [".c", ".cpp", "cc"]:
-                d_port_file = os.path.normpath(os.path.join(d_port_path, os.path.relpath(s_port_path, src), name))
-                self.project['files']['sources'].setdefault(self._get_portable_group(), []).append(os.path.relpath(d_port_file, self.basepath))
-            else:
-                ignore_names.append(name)
-        return ignore_names
+                logger.debug("File to copy %s does not exist" % s)
+        copied, skipped, removed = sink.copy_files(pairs, destination, mode, checksum)
+        logger.info("Copied %d files to %s (%d unchanged, %d removed)" % (copied, destination, skipped, removed))
+        return [os.path.join(destination, rel) for s, rel in pairs] + [os.path.join(destination, SYNC_STATE_FILE)]
     
     def _get_portable_group(self):        
         portable = "%s_%s" % (self.project['portable']['dest'], self.name)
         if self.project['portable']['dest'] not in self.portable_dirs:
             self.portable_dirs.append(self.project['portable']['dest'])
         return portable
-        
-    def _copy_portable_to_destination(self):
-        """ Copies all project portable files to specified project """
-        d_cfg_path = os.path.normpath(os.path.join(self.settings.root, self.basepath, "..", self.project['portable']['dest'], "include", self.name))       
+
+    def _get_portable_root(self):
+        return os.path.normpath(os.path.join(self.settings.root, self.basepath, "..", self.project['portable']['dest']))
+
+    def _add_portable_file(self, src, dst, key):
+        self.inputs.add(src)
+        self.portable_files.append((src, dst))
+        self.project['files'][key].setdefault(self._get_portable_group(), []).append(os.path.relpath(dst, self.basepath))
+
+    def _plan_portable_files(self):
+        """ Collects project portable files and adds them to the project files
+
+        Nothing is written here, files are copied to the destination by materialize_portable()
+        """
+        self.portable_files = []
         for cfg_key in self.project['portable']['config']:
-            d_cfg_path = os.path.normpath(os.path.join(self.settings.root, self.basepath, "..", self.project['portable']['dest'], "include", self.name, cfg_key))
+            d_cfg_path = os.path.join(self._get_portable_root(), "include", self.name, cfg_key)
             for cfg in self.project['portable']['config'][cfg_key]:
                 s_cfg_path = os.path.normpath(os.path.join(self.settings.root, self.basepath, cfg))
                 if os.path.isdir(s_cfg_path):
                     # auto process all header files as config file
-                    copytree(s_cfg_path, d_cfg_path,
-                                     ignore = lambda src, names: self._ignore_source_files(s_cfg_path, d_cfg_path, src, names))                
+                    self.inputs.add(s_cfg_path)
+                    for name, _ in self.gen.list_dir(s_cfg_path):
+                        if os.path.splitext(name)[1] in [".h", ".hpp", "inc"]:
+                            self._add_portable_file(os.path.join(s_cfg_path, name),
+                                                    os.path.join(d_cfg_path, name), 'includes')
                 elif os.path.isfile(s_cfg_path):
-                    if not os.path.exists(d_cfg_path):
-                        os.makedirs(d_cfg_path) 
                     name,ext = os.path.splitext(os.path.basename(s_cfg_path))
-                    d_cfg_file = os.path.join(d_cfg_path, name+".h")
-                    if not os.path.exists(d_cfg_file):
-                        shutil.copy2(s_cfg_path, d_cfg_file)                
-                    self.project['files']['includes'].setdefault(self._get_portable_group(), []).append(os.path.relpath(d_cfg_file, self.basepath))
-                                    
+                    self._add_portable_file(s_cfg_path, os.path.join(d_cfg_path, name+".h"), 'includes')
+
         for port_key in self.project['portable']['port']:
-            d_port_path = os.path.normpath(os.path.join(self.settings.root, self.basepath, "..", self.project['portable']['dest'], "port", self.name, port_key)) 
+            d_port_path = os.path.join(self._get_portable_root(), "port", self.name, port_key)
             for port in self.project['portable']['port'][port_key]:
                 port_name, port_ext = os.path.splitext(port)
                 if port_ext == ".s":
                     port = port_name + port_ext.upper()
                 s_port_path = os.path.normpath(os.path.join(self.settings.root, self.basepath, port))
                 if os.path.isdir(s_port_path):
-                    copytree(s_port_path, d_port_path,
-                                     ignore = lambda src, names: self._ignore_header_files(s_port_path, d_port_path, src, names))
+                    self.inputs.add(s_port_path)
+                    for name, _ in self.gen.list_dir(s_port_path):
+                        if os.path.splitext(name)[1] in [".c", ".cpp", "cc"]:
+                            self._add_portable_file(os.path.join(s_port_path, name),
+                                                    os.path.join(d_port_path, name), 'sources')
                 elif os.path.isfile(s_port_path):
-                    if not os.path.exists(d_port_path):
-                        os.makedirs(d_port_path) 
-                    d_port_file = os.path.join(d_port_path, os.path.basename(s_port_path))
-                    if not os.path.exists(d_port_file):
-                        shutil.copy2(s_port_path, d_port_file)
-                        
-                    self.project['files']['sources'].setdefault(self._get_portable_group(), []).append(os.path.relpath(d_port_file, self.basepath))
-                
+                    self._add_portable_file(s_port_path, os.path.join(d_port_path, os.path.basename(s_port_path)), 'sources')
+
+    def materialize_portable(self, sink=None):
+        """ Copies portable files of the project and all required projects to their destination,
+        sinks which do not write to the disk get them instead """
+        projects = [self]
+        while projects:
+            project = projects.pop(0)
+            projects.extend(project.sub_projects.values())
+            if sink and not sink.on_disk:
+                files = [pair for pair in project.portable_files if pair not in sink.portable_files]
+                root = project._get_portable_root()
+                sink.copy_files([(src, os.path.relpath(dst, root)) for src, dst in files], root)
+                sink.portable_files.update(files)
+                continue
+            # projects might be written by several threads
+            with self.gen.lock:
+                files = [pair for pair in project.portable_files if pair not in self.gen.materialized_portable]
+                if files:
+                    copied = copy_portable_files(files, project._get_portable_root())
+                    if copied:
+                        # directories listed before may contain the copied files now
+                        self.gen.dirs.clear()
+                    logger.debug("Portable files of %s: %d copied, %d up to date" % (project.name, copied, len(files) - copied))
+                    self.gen.materialized_portable.update(files)
+
+    def _get_output_dir_abspath(self):
+        return os.path.normpath(os.path.join(self.settings.root, self.outdir_path))
+
     def clean(self):
         """ Clean a project """
 
-        # We get the export dict formed, then use it for cleaning
-        self._fill_export_dict()
-        path = self.export['output_dir']['path']
-
-        if os.path.isdir(path):
+        path = self._get_output_dir_abspath()
+        if read_manifest(path):
+            clean_outputs([path])
+        elif os.path.isdir(path):
+            # generated before manifests were written
             logger.info("Cleaning directory %s" % path)
-
             shutil.rmtree(path)
+        self.gen.index.remove(self.name, self.tool)
         return 0
 
-    def generate(self, copied=False, copy=False):
-        """ Generates a project """
+    def generate(self, copied=False, copy=False, copy_mode='copy', copy_checksum=False, sink=None, force=False,
+                 cache=None):
+        """ Generates a project, files are written to the sink (the filesystem by default) """
 
-        generated_files = {}
+        self.expand(copied)
+        return self.write(copy, copy_mode, copy_checksum, sink, force, cache)
+
+    def expand(self, copied=False):
+        """ Expands project files and fills the data for the exporter, the first part of generate """
+        start = time.time()
+        self._fill_export_dict(copied)
+        self.expand_time = time.time() - start
+
+    def _get_fingerprint(self, exporter, content=False):
+        """ Digest of what the exported files depend on. The expanded project is resolved
+        from module files, properties, favors and directory listings, the exporter
+        digest covers its code and templates. User templates are identified by size and mtime,
+        by their content if content is set (the same in all workspaces). Otherwise the version
+        of progen and the stamp of the target definitions are included """
+        stats = []
+        for template in self._get_templates():
+            path = os.path.join(self.settings.root, template)
+            try:
+                if content:
+                    stats.append([template, file_digest(path)])
+                else:
+                    stat = os.stat(path)
+                    stats.append([template, stat.st_size, stat.st_mtime])
+            except (IOError, OSError):
+                stats.append([template, None])
+        data = {
+            'tool': self.tool,
+            'export': self.export,
+            'exporter': get_exporter_digest(exporter),
+            'settings': [self.settings.paths, self.settings.templates],
+            'templates': stats,
+        }
+        if not content:
+            data['root'] = self.settings.root
+            data['version'] = get_version()
+            data['definitions'] = get_target_definitions().stamp
+        return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _get_templates(self):
+        """ User template files of the project and of settings """
+        templates = list(self.export.get('template') or [])
+        for paths in self.settings.templates.values():
+            templates.extend(paths if type(paths) is list else [paths])
+        return templates
+
+    def get_inputs(self):
+        """ Files and directories the generated project depends on: the projects file, module
+        files and portable sources of all projects resolved with it (they inherit from each
+        other), user templates and directories listed when the project was expanded """
+        root = self
+        while root.parent:
+            root = root.parent
+        inputs = set([self.gen.source])
+        projects = [root]
+        while projects:
+            project = projects.pop()
+            inputs.update(project.inputs)
+            projects.extend(project.sub_projects.values())
+        inputs.update(self.listed_dirs)
+        inputs.update(os.path.join(self.settings.root, template) for template in self._get_templates())
+        return inputs
+
+    def write(self, copy=False, copy_mode='copy', copy_checksum=False, sink=None, force=False, cache=None):
+        """ Exports the expanded project, the second part of generate.
+
+        The exporter is skipped if the output directory was generated from the same
+        fingerprint, unless forced. Projects with copied sources are always exported,
+        copying is incremental on its own. Otherwise files are restored from the cache
+        if it has them (not if forced), files which are exported are stored to it.
+        """
+
+        start = time.time()
         result = 0
         exporter = ToolsSupported().get_tool(self.tool)
         
@@ -660,28 +776,162 @@ class Project:
             result = -1
             logger.debug("Tool: %s was not found" % self.tool)
 
-        self._fill_export_dict(copied)
-        if copy:
-            logger.debug("Copying sources to the output directory")
-            self._copy_sources_to_generated_destination()
-        
+        sink = sink or FileSink()
+        self.materialize_portable(sink)
+
         # dump a log file if debug is enabled
         if logger.isEnabledFor(logging.DEBUG):
             dump_data = {}
             dump_data['files'] = self.project['files']
-            dump_data['tool_specific'] = self.project['tool_specific']
+            dump_data['tool_specific'] = {'TargetOption': self.project['TargetOption']}
             dump_data['merged'] = self.export
-            handler = logging.FileHandler(os.path.join(os.getcwd(), "%s.log" % self.name),"w", encoding=None, delay="true")
-            handler.setLevel(logging.DEBUG)
-            logger.addHandler(handler)
-            logger.debug("\n" + yaml.dump(dump_data))
-
-        files = exporter(self.export, self.settings).export_project()
-        generated_files[self.tool] = files
-        self.generated_files = generated_files
-        
+            dump = yaml.dump(dump_data)
+            if sink.on_disk:
+                # written here, a handler added to the module logger would get records of all projects
+                with open(os.path.join(os.getcwd(), "%s.log" % self.name), 'w') as f:
+                    f.write("\n" + dump)
+            logger.debug("\n" + dump)
+
+        if not sink.on_disk:
+            self._export(exporter, sink, copy, copy_mode, copy_checksum)
+            return result
+
+        fingerprint = None if copy else self._get_fingerprint(exporter)
+        # processes sharing the workspace write the output directory one at a time
+        output_dir = self._get_output_dir_abspath()
+        created = self._get_missing_dir(output_dir)
+        existing = None
+        try:
+            with FileLock(output_dir):
+                manifest = read_manifest(output_dir)
+                if not manifest:
+                    # nothing lists the directory yet, a failed export leaves it as it was
+                    existing = self._get_tree(output_dir)
+                try:
+                    self.status = get_status(manifest, output_dir, fingerprint, force)
+                    if self.status == UNCHANGED:
+                        self.generated_files = {self.tool: manifest['generated']}
+                    else:
+                        outputs = self._export_cached(exporter, sink, output_dir, fingerprint, cache, force) \
+                            if cache and fingerprint else self._export(exporter, sink, copy, copy_mode, copy_checksum)
+                        # record what was generated, clean removes exactly these files
+                        write_manifest(output_dir, self.name, self.tool,
+                                       [os.path.abspath(f) for f in outputs] + [os.path.join(output_dir, DEPFILE)],
+                                       fingerprint, self.generated_files[self.tool])
+                    # written even if unchanged, the project is up to date with its inputs now
+                    write_depfile(output_dir, self.get_inputs())
+                except Exception:
+                    if existing is not None:
+                        self._remove_failed_files(output_dir, existing[0])
+                    raise
+        except Exception:
+            if existing is not None:
+                self._remove_failed_dirs(output_dir, created, existing[1])
+            raise
+        logger.debug("Project %s (%s): %s" % (self.name, self.tool, self.status))
+        duration = self.expand_time + time.time() - start
+        if self.status == UNCHANGED:
+            # the duration of the last generation, shards are balanced by it
+            duration = self.gen.index.get_duration(self.name, self.tool)
+        self.gen.index.add(self.name, self.tool, output_dir,
+            [name for name, sproj in self.sub_projects.items() if sproj.project['type'] != 'src'], duration)
+
         return result
 
+    @staticmethod
+    def _get_missing_dir(path):
+        """ The topmost directory of the path which does not exist, None if the path exists """
+        missing = None
+        while path and not os.path.isdir(path):
+            missing = path
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+        return missing
+
+    @staticmethod
+    def _get_tree(output_dir):
+        """ Files ({path: stat}) and directories (set) within the output directory, the lock excluded """
+        files = {}
+        dirs = set()
+        for root, dirnames, names in os.walk(output_dir):
+            dirs.update(os.path.join(root, name) for name in dirnames)
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if path != os.path.join(output_dir, LOCK_FILE):
+                    files[path] = (stat.st_ino, stat.st_size, stat.st_mtime)
+        return files, dirs
+
+    def _remove_failed_files(self, output_dir, existing):
+        """ Removes files a failed export created or replaced, the lock is held """
+        for path, stat in self._get_tree(output_dir)[0].items():
+            if existing.get(path) != stat:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _remove_failed_dirs(self, output_dir, created, existing):
+        """ Removes the lock and directories a failed export created, once the lock is released
+        (as clean does). Kept if another process has generated the directory meanwhile """
+        if read_manifest(output_dir):
+            return
+        try:
+            os.remove(os.path.join(output_dir, LOCK_FILE))
+        except OSError:
+            pass
+        # deepest directories first, only empty ones are removed
+        dirs = self._get_tree(output_dir)[1] - existing
+        for path in sorted(dirs, key=lambda d: d.count(os.sep), reverse=True):
+            try:
+                os.rmdir(path)
+            except OSError:
+                pass
+        if created:
+            # the output directory and parents created for it, unless other projects use them
+            path = output_dir
+            while len(path) >= len(created):
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    break
+                path = os.path.dirname(path)
+
+    def _export_cached(self, exporter, sink, output_dir, fingerprint, cache, force=False):
+        """ Restores generated files from the cache, exports and stores them if not cached """
+        key = get_key(self._get_fingerprint(exporter, True), exporter)
+        data = None if force else cache.get(key)
+        if data is not None:
+            try:
+                outputs, self.generated_files[self.tool] = unpack(data, output_dir)
+                logger.debug("Project %s (%s) restored from the cache" % (self.name, self.tool))
+                return outputs
+            except Exception as e:
+                logger.warning("Cache entry %s of %s is not valid: %s" % (key, self.name, e))
+        outputs = self._export(exporter, sink)
+        data = pack(output_dir, outputs, self.generated_files[self.tool])
+        if data is not None:
+            cache.put(key, data)
+        return outputs
+
+    def _export(self, exporter, sink, copy=False, copy_mode='copy', copy_checksum=False):
+        """ Copies sources if requested and exports the project, returns list of written files """
+        outputs = []
+        if copy:
+            logger.debug("Copying sources to the output directory")
+            outputs = self._copy_sources_to_generated_destination(copy_mode, copy_checksum, sink)
+
+        tool_exporter = exporter(self.export, self.settings)
+        tool_exporter.outputs = outputs
+        tool_exporter.sink = sink
+        self.generated_files = {self.tool: tool_exporter.export_project()}
+        return outputs
+
     def build(self):
         """build the project"""
 
@@ -14,11 +14,14 @@
 
 import os
 
-from os.path import normpath, join, pardir, sep
+from os.path import normpath, join, pardir, sep, expanduser
 
 class ProjectSettings:
     PROJECT_ROOT = os.environ.get('PROJECT_GENERATOR_ROOT') or join(pardir, pardir)
     DEFAULT_TOOL = os.environ.get('PROJECT_GENERATOR_DEFAULT_TOOL') or 'uvision'
+    # persistent caches shared by progen invocations (compiled templates, ...)
+    CACHE_DIR = os.environ.get('PROJECT_GENERATOR_CACHE') or join(
+        os.environ.get('XDG_CACHE_HOME') or join(expanduser('~'), '.cache'), 'progen')
 
     DEFAULT_EXPORT_LOCATION_FORMAT = join('generated_projects', '{tool}_{project_name}')
     DEFAULT_ROOT = os.getcwd()
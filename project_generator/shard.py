@@ -0,0 +1,117 @@
+# Copyright 2014-2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import logging
+
+from .util import load_json
+
+logger = logging.getLogger('progen.shard')
+
+def get_closures(generator, tools):
+    """ Returns {root project: set of projects generated with it} for all tools.
+    A root is generated with its required projects, except 'src' ones """
+    closures = {}
+    projects = {}
+    for tool in tools:
+        for name in sorted(generator.projects_dict.get('projects', {}).keys()):
+            root = next(generator.generate(name, tool))
+            closure = closures.setdefault(name, set([name]))
+            projects[(name, tool)] = root
+            stack = [root]
+            while stack:
+                project = stack.pop()
+                for sproj in project.sub_projects.values():
+                    if sproj.project['type'] != 'src':
+                        closure.add(sproj.name)
+                        projects.setdefault((sproj.name, tool), sproj)
+                    stack.append(sproj)
+    return closures, projects
+
+def count_files(project):
+    """ Number of source and include files of a project, directories are listed """
+    count = 0
+    for key in ['sources', 'includes']:
+        for files in project.project['files'][key].values():
+            for f in files or []:
+                path = os.path.normpath(os.path.join(project.basepath, f))
+                if os.path.isdir(path):
+                    count += len([name for name, is_file in project.gen.list_dir(path) if is_file])
+                else:
+                    count += 1
+    return count
+
+def get_costs(generator, projects, durations=None):
+    """ Returns {project: cost} summed over tools, file counts by default. Shards are computed
+    the same way on all machines only if they see the same costs, durations recorded in the
+    local index differ between machines and runs. durations is a file shared by all of them
+    (an index file, {project: {tool: {'duration': seconds}}}), used if it has a duration for
+    each project and tool """
+    records = load_json(durations, None) if durations else None
+    if durations and records is None:
+        logger.warning("Shard durations %s can't be read, file counts are used" % durations)
+    records = records or {}
+    recorded = dict((key, records.get(key[0], {}).get(key[1], {}).get('duration')) for key in projects)
+    costs = {}
+    if records and all(duration is not None for duration in recorded.values()):
+        logger.debug("Shard costs are durations from %s" % durations)
+        for (name, tool), duration in recorded.items():
+            costs[name] = costs.get(name, 0) + duration
+    else:
+        for (name, tool), project in projects.items():
+            costs[name] = costs.get(name, 0) + count_files(project)
+    return costs
+
+def partition(closures, costs, count):
+    """ Partitions root projects to count shards, returns a list of sorted lists of roots.
+
+    Roots sharing a required project are kept in one shard, which generates and builds
+    the shared project. Groups are assigned from the largest one to the least loaded
+    shard, ties broken by names and shard order, the result depends only on the input.
+    """
+    # union of roots with a common required project
+    owner = {}
+    groups = {}
+    for root in sorted(closures):
+        group = set([root])
+        for other in sorted(set(owner[name] for name in closures[root] if name in owner)):
+            group.update(groups.pop(other))
+        for member in group:
+            for name in closures[member]:
+                owner[name] = root
+        groups[root] = group
+
+    units = []
+    for group in groups.values():
+        names = set()
+        for root in group:
+            names.update(closures[root])
+        units.append((-sum(costs.get(name, 0) for name in names), sorted(group)))
+
+    shards = [[] for i in range(count)]
+    loads = [0] * count
+    for cost, roots in sorted(units):
+        i = min(range(count), key=lambda i: (loads[i], i))
+        shards[i].extend(roots)
+        loads[i] -= cost
+    return [sorted(roots) for roots in shards]
+
+def get_shard(generator, tool, index, count, durations=None):
+    """ Root projects of the shard index (1 to count) for the tool or list of tools,
+    durations is a shared file with costs (see get_costs) """
+    tools = tool if isinstance(tool, (list, tuple)) else [tool]
+    closures, projects = get_closures(generator, tools)
+    shards = partition(closures, get_costs(generator, projects, durations), count)
+    logger.debug("Shards: %s" % shards)
+    return shards[index - 1]
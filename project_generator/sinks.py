@@ -0,0 +1,180 @@
+# Copyright 2014-2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import io
+import time
+import tarfile
+import zipfile
+import logging
+
+from .util import write_file_if_changed, write_chunks_if_changed, encode_text, sync_files
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger('progen.sinks')
+
+# Output sinks receive all files produced by exporters. The default sink writes them
+# to the filesystem, others can collect them elsewhere, without intermediate files.
+class Sink(object):
+    """Just a sink template for subclassing"""
+
+    # generated files can be found on the disk afterwards (manifests are written)
+    on_disk = False
+
+    def __init__(self):
+        # (source, destination) portable files already stored in the sink
+        self.portable_files = set()
+
+    def write(self, path, text):
+        """ Store the generated text as path, returns True if stored (False if unchanged) """
+        raise NotImplementedError
+
+    def write_chunks(self, path, chunks):
+        """ Store the text generated in chunks as path, same as write """
+        return self.write(path, u''.join(chunks))
+
+    def copy_files(self, files, destination, mode='copy', checksum=False):
+        """ Store files (list of (source, relative path) tuples) within the destination,
+        returns number of (copied, skipped, removed) files """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class FileSink(Sink):
+    """ Writes files to the filesystem """
+
+    on_disk = True
+
+    def write(self, path, text):
+        return write_file_if_changed(path, text)
+
+    def write_chunks(self, path, chunks):
+        return write_chunks_if_changed(path, chunks)
+
+    def copy_files(self, files, destination, mode='copy', checksum=False):
+        return sync_files(files, destination, mode, checksum)
+
+class ArchiveSink(Sink):
+    """ Streams files into a zip or tar archive (.zip, .tar, .tar.gz, .tgz, .tar.bz2, .tar.zst)
+
+    Paths in the archive are relative to the root directory.
+    """
+
+    TAR_MODES = {
+        '.tar': 'w|',
+        '.tar.gz': 'w|gz',
+        '.tgz': 'w|gz',
+        '.tar.bz2': 'w|bz2',
+        '.tar.zst': 'w|',
+    }
+
+    def __init__(self, path, root=None):
+        Sink.__init__(self)
+        self.path = path
+        self.root = root or os.getcwd()
+        # all members get the same timestamp
+        self.mtime = int(time.time())
+        self.names = set()
+        self.zip = self.tar = self.compressor = None
+        self.fileobj = None
+
+        if path.endswith('.zip'):
+            self.zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+            return
+        for extension, mode in self.TAR_MODES.items():
+            if path.endswith(extension):
+                break
+        else:
+            raise ValueError("Archive %s has an unsupported format, use one of: .zip, %s" %
+                             (path, ", ".join(sorted(self.TAR_MODES.keys()))))
+        if extension == '.tar.zst' and zstandard is None:
+            raise ValueError("Archive %s requires the zstandard package" % path)
+
+        self.fileobj = open(path, 'wb')
+        if extension == '.tar.zst':
+            self.compressor = zstandard.ZstdCompressor().stream_writer(self.fileobj)
+            self.tar = tarfile.open(fileobj=self.compressor, mode=mode)
+        else:
+            self.tar = tarfile.open(fileobj=self.fileobj, mode=mode)
+
+    def _get_name(self, path):
+        name = os.path.relpath(os.path.join(self.root, path), self.root).replace(os.sep, '/')
+        if name in self.names:
+            logger.warning("%s is already in the archive %s" % (name, self.path))
+        self.names.add(name)
+        return name
+
+    def _add(self, name, data):
+        if self.zip:
+            info = zipfile.ZipInfo(name, time.localtime(self.mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            self.zip.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = self.mtime
+            info.mode = 0o644
+            self.tar.addfile(info, io.BytesIO(data))
+
+    def write(self, path, text):
+        self._add(self._get_name(path), encode_text(text))
+        return True
+
+    def copy_files(self, files, destination, mode='copy', checksum=False):
+        for src, rel in files:
+            with open(src, 'rb') as f:
+                self._add(self._get_name(os.path.join(destination, rel)), f.read())
+        return len(files), 0, 0
+
+    def close(self):
+        if self.zip:
+            self.zip.close()
+            return
+        self.tar.close()
+        if self.compressor:
+            self.compressor.flush(zstandard.FLUSH_FRAME)
+        self.fileobj.close()
+
+class MemorySink(Sink):
+    """ Collects files in memory, files is a dictionary {relative path: bytes}
+
+    Paths are relative to the root directory, with / as separator.
+    """
+
+    def __init__(self, root=None):
+        Sink.__init__(self)
+        self.root = root or os.getcwd()
+        self.files = {}
+
+    def _get_name(self, path):
+        return os.path.relpath(os.path.join(self.root, path), self.root).replace(os.sep, '/')
+
+    def write(self, path, text):
+        name = self._get_name(path)
+        text = encode_text(text)
+        changed = self.files.get(name) != text
+        self.files[name] = text
+        return changed
+
+    def copy_files(self, files, destination, mode='copy', checksum=False):
+        for src, rel in files:
+            with open(src, 'rb') as f:
+                self.files[self._get_name(os.path.join(destination, rel))] = f.read()
+        return len(files), 0, 0
@@ -0,0 +1,179 @@
+# Copyright 2014-2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import copy
+import atexit
+import hashlib
+import logging
+import threading
+
+from project_generator_definitions.definitions import ProGenDef
+from project_generator_definitions.target import targets as definitions_targets
+
+from .settings import ProjectSettings
+from .util import load_json, dump_json
+
+logger = logging.getLogger('progen.targets')
+
+# mcu records loaded from the definitions, stored in the progen cache directory
+INDEX_FILE = 'definitions.json'
+
+try:
+    _text_type = unicode
+except NameError:
+    _text_type = str
+
+def _to_native(data):
+    # json gives unicode strings in python 2, yaml str if they are ascii, records from the
+    # index are the same as parsed ones
+    if _text_type is str:
+        return data
+    if isinstance(data, dict):
+        return dict((_to_native(k), _to_native(v)) for k, v in data.items())
+    if isinstance(data, list):
+        return [_to_native(v) for v in data]
+    if isinstance(data, _text_type):
+        try:
+            return data.encode('ascii')
+        except UnicodeEncodeError:
+            return data
+    return data
+
+class TargetDefinitions(object):
+    """ Cached access to targets and mcus from project_generator_definitions.
+
+    A mcu record (yaml) is loaded once per process. Loaded records are kept in an index
+    in the progen cache directory, valid as long as the definitions files are the same
+    (a different version of the package is installed), the index is written by flush().
+    Definitions returned are copies, exporters are free to modify them.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.progendef = ProGenDef()
+        # targets and mcus, mcus are preferred if a name is both
+        self.names = set(self.progendef.targets_mcu_list)
+        self.path = os.path.join(cache_dir or ProjectSettings.CACHE_DIR, INDEX_FILE)
+        self.stamp = self._get_stamp()
+        self.digest = None
+        self.lock = threading.Lock()
+        index = load_json(self.path, {})
+        self.records = _to_native(index.get('records', {})) if index.get('stamp') == self.stamp else {}
+        # records not in the index yet
+        self.dirty = False
+        self.targets = None
+        self.debuggers = {}
+
+    def _get_files(self):
+        return sorted(list(self.progendef.mcus.mcus.values()) + [os.path.splitext(definitions_targets.__file__)[0] + '.py'])
+
+    def _get_stamp(self):
+        # changes with any file of the definitions, cheaper than asking for the package version
+        digest = hashlib.sha1()
+        for path in self._get_files():
+            stat = os.stat(path)
+            digest.update(('%s %d %d\n' % (path, stat.st_size, int(stat.st_mtime))).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get_digest(self):
+        """ Digest of the content of the definitions files, the same wherever the package
+        is installed. Computed once """
+        with self.lock:
+            if self.digest is None:
+                package_dir = os.path.dirname(os.path.dirname(definitions_targets.__file__))
+                digest = hashlib.sha1()
+                for path in self._get_files():
+                    digest.update(os.path.relpath(path, package_dir).replace(os.sep, '/').encode('utf-8'))
+                    with open(path, 'rb') as f:
+                        digest.update(f.read())
+                self.digest = digest.hexdigest()
+            return self.digest
+
+    def flush(self):
+        """ Writes loaded records to the index, merged with records other processes stored """
+        with self.lock:
+            if not self.dirty:
+                return
+            index = load_json(self.path, {})
+            records = index.get('records', {}) if index.get('stamp') == self.stamp else {}
+            records.update(self.records)
+            try:
+                dump_json(self.path, {'stamp': self.stamp, 'records': records})
+            except (IOError, OSError):
+                logger.debug("Target definitions index %s is not accessible" % self.path)
+            self.dirty = False
+
+    def _get_record(self, target):
+        if target not in self.names:
+            return None
+        with self.lock:
+            if target not in self.records:
+                record = self.progendef.mcus.get_mcu_record(target)
+                if record is None:
+                    record = self.progendef.targets.get_mcu_record(target)
+                self.records[target] = record
+                self.dirty = True
+            return self.records[target]
+
+    def get_targets(self):
+        with self.lock:
+            if self.targets is None:
+                self.targets = self.progendef.get_targets()
+            return list(self.targets)
+
+    def get_mcus(self):
+        return self.progendef.get_mcus()
+
+    def is_supported(self, target, tool=None):
+        """ Returns True if target is in definitions, with tool specific definitions if tool is set """
+        if target.lower() not in self.names:
+            logger.debug("Target not found in definitions")
+            return False
+        if not tool:
+            return True
+        try:
+            return tool in self._get_record(target)['tool_specific']
+        except (TypeError, KeyError):
+            return False
+
+    def get_tool_definition(self, target, tool):
+        """ Returns a copy of tool specific definitions or None if not defined for the tool """
+        try:
+            return copy.deepcopy(self._get_record(target)['tool_specific'][tool])
+        except (TypeError, KeyError):
+            return None
+
+    def get_mcu_core(self, target):
+        try:
+            return copy.deepcopy(self._get_record(target)['mcu']['core'])
+        except (TypeError, KeyError):
+            return None
+
+    def get_debugger(self, target):
+        with self.lock:
+            if target not in self.debuggers:
+                self.debuggers[target] = self.progendef.get_debugger(target)
+            return copy.deepcopy(self.debuggers[target])
+
+_target_definitions = None
+_target_definitions_lock = threading.Lock()
+
+def get_target_definitions():
+    """ The process wide TargetDefinitions """
+    global _target_definitions
+    with _target_definitions_lock:
+        if _target_definitions is None:
+            _target_definitions = TargetDefinitions()
+            atexit.register(_target_definitions.flush)
+    return _target_definitions
@@ -0,0 +1,78 @@
+# Copyright 2014-2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# This module is also executed by setup.py to compile templates when the package
+# is built, keep it importable with jinja2 only.
+
+import os
+import json
+import hashlib
+
+import jinja2
+from jinja2 import BaseLoader, FileSystemLoader, ModuleLoader, Environment
+
+# templates compiled to python modules when the package is built
+COMPILED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates_compiled')
+# jinja2 version and the digest of each compiled template source
+STAMP_FILE = 'stamp.json'
+TEMPLATE_EXTENSIONS = ['tmpl']
+
+def _digest(source):
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+def compile_templates(template_dir, target):
+    """ Compile templates from template_dir to python modules in the target directory """
+    env = Environment(loader=FileSystemLoader(template_dir))
+    env.compile_templates(target, extensions=TEMPLATE_EXTENSIONS, zip=None, ignore_errors=False)
+    stamp = {
+        'jinja2': jinja2.__version__,
+        'templates': dict((name, _digest(env.loader.get_source(env, name)[0]))
+                          for name in env.list_templates(extensions=TEMPLATE_EXTENSIONS)),
+    }
+    with open(os.path.join(target, STAMP_FILE), 'wt') as f:
+        json.dump(stamp, f, indent=1, sort_keys=True)
+
+class PrecompiledLoader(BaseLoader):
+    """ Loads templates compiled ahead of time, falls back to the template sources.
+
+    A compiled template is used only if it was compiled by the installed jinja2 from
+    the same source, a template modified after the package was built is compiled
+    from its source.
+    """
+
+    def __init__(self, template_dir, compiled_dir=COMPILED_DIR):
+        self.sources = FileSystemLoader(template_dir)
+        self.modules = None
+        self.digests = {}
+        try:
+            with open(os.path.join(compiled_dir, STAMP_FILE), 'rt') as f:
+                stamp = json.load(f)
+            if stamp['jinja2'] == jinja2.__version__:
+                self.modules = ModuleLoader(compiled_dir)
+                self.digests = stamp['templates']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def get_source(self, environment, template):
+        return self.sources.get_source(environment, template)
+
+    def list_templates(self):
+        return self.sources.list_templates()
+
+    def load(self, environment, name, globals=None):
+        if self.modules and name in self.digests:
+            source = self.sources.get_source(environment, name)[0]
+            if _digest(source) == self.digests[name]:
+                return self.modules.load(environment, name, globals)
+        return self.sources.load(environment, name, globals)
@@ -21,6 +21,8 @@ from ..util import SOURCE_KEYS
 
 class CMakeGccArm(Tool,Exporter):
 
+    embeds_cwd = True
+
     generated_project = {
         'path': '',
         'files': {
@@ -67,7 +69,7 @@ class CMakeGccArm(Tool,Exporter):
 
         data_for_make = self.workspace.copy()
         # Warning: we dont use rel path for cmake, we inject there root and use paths within root
-        data_for_make['output_dir']['rel_path'] = ""
+        data_for_make['output_dir'] = dict(data_for_make['output_dir'], rel_path="")
         self.exporter.process_data_for_makefile(data_for_make)
         try:
             data_for_make['misc'] = data_for_make['misc']
@@ -13,16 +13,15 @@
 # limitations under the License.
 
 import logging
-import xmltodict
 from collections import OrderedDict
 import copy
 import re
 
 from os.path import basename, join, normpath, splitext
 from os import getcwd
-from project_generator_definitions.definitions import ProGenDef
+from ..targets import get_target_definitions
 
-from .tool import Tool, Builder, Exporter
+from .tool import Tool, Builder, Exporter, OptionIndex, parse_xml
 from ..util import SOURCE_KEYS
 
 logger = logging.getLogger('progen.tools.coide')
@@ -59,6 +58,11 @@ class Coide(Tool, Exporter, Builder):
         }
     }
 
+    # files are set by _coproj_set_files, not loaded from templates
+    COPROJ_SKIPPED = [('Project', 'Files')]
+    # debug option selecting the debugger
+    DEBUGGER_ADAPTER = 'org.coocox.codebugger.gdbjtag.core.adapter'
+
     def __init__(self, workspace, env_settings):
         self.definitions = CoIDEdefinitions()
         self.workspace = workspace
@@ -122,13 +126,17 @@ class Coide(Tool, Exporter, Builder):
         coproj_dic['Project']['Target']['BuildOption']['Link']['LocateLinkFile']['@path'] = project_dic['linker_file']
 
     def _coproj_find_option(self, option_dic, key_to_find, value_to_match):
-        i = 0
-        for option in option_dic:
-            for k,v in option.items():
-                if k == key_to_find and value_to_match == v:
-                    return i
-            i += 1
-        return None
+        return OptionIndex(option_dic, key_to_find).index(value_to_match)
+
+    def _coproj_set_debugger(self, coproj_dic, debugger_def):
+        debug_options = OptionIndex(coproj_dic['Project']['Target']['DebugOption']['Option'], '@name')
+        adapter = debug_options.get(self.DEBUGGER_ADAPTER)
+        if adapter is not None:
+            adapter['@value'] = debugger_def['Target']['DebugOption'][self.DEBUGGER_ADAPTER]
+
+    def _get_default_coproj(self):
+        # the default is shared by all exporters, a copy is filled in
+        return copy.deepcopy(self.definitions.coproj_file)
 
     def _export_single_project(self):
         """ Processes groups and misc options specific for CoIDE, and run generator """
@@ -150,29 +158,29 @@ class Coide(Tool, Exporter, Builder):
                 template = join(getcwd(), template)
                 if splitext(template)[1] == '.coproj' or re.match('.*\.coproj.tmpl$', template):
                     try:
-                        coproj_dic = xmltodict.parse(open(template))
+                        coproj_dic = parse_xml(template, skip=self.COPROJ_SKIPPED)
                     except IOError:
                         logger.info("Template file %s not found. Using default template" % template)
-                        coproj_dic = self.definitions.coproj_file
+                        coproj_dic = self._get_default_coproj()
                 else:
                     logger.info("Template file %s contains unknown template extension (.coproj/.coproj.tmpl are valid). Using default one" % template)
-                    coproj_dic = self.definitions.coproj_file
+                    coproj_dic = self._get_default_coproj()
         elif 'coide' in self.env_settings.templates.keys():
             # template overrides what is set in the yaml files
             for template in self.env_settings.templates['coide']:
                 template = join(getcwd(), template)
                 if splitext(template)[1] == '.coproj' or re.match('.*\.coproj.tmpl$', template):
                     try:
-                        coproj_dic = xmltodict.parse(open(template))
+                        coproj_dic = parse_xml(template, skip=self.COPROJ_SKIPPED)
                     except IOError:
                         logger.info("Template file %s not found. Using default template" % template)
-                        coproj_dic = self.definitions.coproj_file
+                        coproj_dic = self._get_default_coproj()
                 else:
                     logger.info("Template file %s contains unknown template extension (.coproj/.coproj.tmpl are valid). Using default one" % template)
-                    coproj_dic = self.definitions.coproj_file
+                    coproj_dic = self._get_default_coproj()
         else:
             # setting values from the yaml files
-            coproj_dic = self.definitions.coproj_file
+            coproj_dic = self._get_default_coproj()
 
         # set name and target
         try:
@@ -192,10 +200,10 @@ class Coide(Tool, Exporter, Builder):
 
         # set target only if defined, otherwise use from template/default one
         if expanded_dic['target']:
-            pro_def = ProGenDef('coide')
-            if not pro_def.is_supported(expanded_dic['target'].lower()):
+            pro_def = get_target_definitions()
+            if not pro_def.is_supported(expanded_dic['target'].lower(), 'coide'):
                 raise RuntimeError("Target %s is not supported." % expanded_dic['target'].lower())
-            mcu_def_dic = pro_def.get_tool_definition(expanded_dic['target'].lower())
+            mcu_def_dic = pro_def.get_tool_definition(expanded_dic['target'].lower(), 'coide')
             if not mcu_def_dic:
                  raise RuntimeError(
                     "Mcu definitions were not found for %s. Please add them to https://github.com/0xc0170/project_generator_definitions"
@@ -220,18 +228,9 @@ class Coide(Tool, Exporter, Builder):
             # coproj_dic['Project']['Target']['DebugOption'].update(mcu_def_dic['DebugOption'])
             coproj_dic['Project']['Target']['BuildOption']['Link']['MemoryAreas']['Memory'] = memory_areas
 
-            # TODO 0xc0170: create a method and look at finding that option if we can reuse already defined method
             try:
-                # find debugger definitions in the list of options
-                index = 0
-                for option in coproj_dic['Project']['Target']['DebugOption']['Option']:
-                    # ??? k, v not used ???
-                    for k, v in option.items():
-                        if option['@name'] == 'org.coocox.codebugger.gdbjtag.core.adapter':
-                            found = index
-                index += 1
-                debugger_name =pro_def.get_debugger(expanded_dic['target'])['name']
-                coproj_dic['Project']['Target']['DebugOption']['Option'][found]['@value'] = self.definitions.debuggers[debugger_name]['Target']['DebugOption']['org.coocox.codebugger.gdbjtag.core.adapter']
+                debugger_name = pro_def.get_debugger(expanded_dic['target'])['name']
+                self._coproj_set_debugger(coproj_dic, self.definitions.debuggers[debugger_name])
             except (TypeError, KeyError) as err:
                 pass
 
@@ -239,15 +238,7 @@ class Coide(Tool, Exporter, Builder):
         # get debugger definitions
         if expanded_dic['debugger']:
             try:
-                # find debugger definitions in the list of options
-                index = 0
-                for option in coproj_dic['Project']['Target']['DebugOption']['Option']:
-                    # ??? k, v not used ???
-                    for k, v in option.items():
-                        if option['@name'] == 'org.coocox.codebugger.gdbjtag.core.adapter':
-                            found = index
-                index += 1
-                coproj_dic['Project']['Target']['DebugOption']['Option'][found]['@value'] = self.definitions.debuggers[expanded_dic['debugger']]['Target']['DebugOption']['org.coocox.codebugger.gdbjtag.core.adapter']
+                self._coproj_set_debugger(coproj_dic, self.definitions.debuggers[expanded_dic['debugger']])
             except KeyError:
                 raise RuntimeError("Debugger %s is not supported" % expanded_dic['debugger'])
 
@@ -368,6 +368,7 @@ class EclipseGnuMCU(Tool, Exporter, Builder):
                      'source_files_c', 'source_files_cpp', 'source_files_s']:            
             expanded_dic[name] = self._fixed_path_2_unix_style(expanded_dic[name])
             
+        expanded_dic['linker'] = dict(expanded_dic['linker'])
         expanded_dic['linker']['search_paths'] = self._fixed_path_2_unix_style(expanded_dic['linker']['search_paths'])
                         
         groups = self._get_groups(expanded_dic)
@@ -391,6 +392,9 @@ class EclipseGnuMCU(Tool, Exporter, Builder):
         expanded_dic["options"]["fpu"] = EclipseGnuMCU.get_mfpu_gnuarmeclipse_id("")
         expanded_dic["options"]["unalignedaccess"] = EclipseGnuMCU.get_unalignedaccess_gnuarmeclipse_id("")
         
+        # defaults stay untouched, export can be run again
+        bool_options = dict(self.GNU_MCU_BOOL_COMMAND2OPTIONS)
+        str_options = dict(self.GNU_MCU_STR_COMMAND2OPTIONS)
         c_flags = []
         cxx_flags = []
         asm_flags = []
@@ -411,10 +415,10 @@ class EclipseGnuMCU(Tool, Exporter, Builder):
                     expanded_dic["options"]["fpu"] = EclipseGnuMCU.get_mfpu_gnuarmeclipse_id(flag)
                 elif flag in ["-munaligned-access","-mno-unaligned-access"]:
                     expanded_dic["options"]["unalignedaccess"] = EclipseGnuMCU.get_unalignedaccess_gnuarmeclipse_id(flag)
-                elif flag.replace(" ","") in self.GNU_MCU_BOOL_COMMAND2OPTIONS:
-                    self.GNU_MCU_BOOL_COMMAND2OPTIONS[flag.replace(" ","")] = "true"
-                elif flag.replace(" ","") in self.GNU_MCU_STR_COMMAND2OPTIONS:
-                    self.GNU_MCU_BOOL_COMMAND2OPTIONS[flag.replace(" ","")] = flag
+                elif flag.replace(" ","") in bool_options:
+                    bool_options[flag.replace(" ","")] = "true"
+                elif flag.replace(" ","") in str_options:
+                    str_options[flag.replace(" ","")] = flag
                 elif name == "common" :
                     c_flags.append(flag)
                     cxx_flags.append(flag)
@@ -428,8 +432,8 @@ class EclipseGnuMCU(Tool, Exporter, Builder):
                 else:
                     ld_flags.append(flag)
 
-        expanded_dic["options"]["value"] = self.GNU_MCU_BOOL_COMMAND2OPTIONS
-        expanded_dic["options"]["value"].update(self.GNU_MCU_STR_COMMAND2OPTIONS)
+        expanded_dic["options"]["value"] = bool_options
+        expanded_dic["options"]["value"].update(str_options)
         expanded_dic["options"]["other_ld_flags"] = " ".join(ld_flags)
         expanded_dic["options"]["other_c_flags"]  = " ".join(c_flags)
         expanded_dic["options"]["other_cxx_flags"] = " ".join(cxx_flags)
@@ -14,7 +14,6 @@
 
 import copy
 import logging
-import xmltodict
 import subprocess
 from subprocess import Popen, PIPE
 import time
@@ -25,9 +24,9 @@ import os
 from os import getcwd
 from os.path import join, normpath
 from collections import OrderedDict
-from project_generator_definitions.definitions import ProGenDef
+from ..targets import get_target_definitions
 
-from .tool import Tool, Builder, Exporter
+from .tool import Tool, Builder, Exporter, OptionIndex, parse_xml
 from ..util import SOURCE_KEYS, FILES_EXTENSIONS, fix_paths
 
 logger = logging.getLogger('progen.tools.iar')
@@ -98,77 +97,69 @@ class IAREmbeddedWorkbenchProject:
         """ Set option (state) """
         settings['state'] = value
 
-    def _get_option(self, settings, find_key):
-        """ Return index for provided key """
-        # This is used as in IAR template, everything 
-        # is as an array with random positions. We look for key with an index
-        for option in settings:
-            if option['name'] == find_key:
-                return settings.index(option)
+    def _get_options(self, settings, name):
+        """ Index of options in the settings block name, settings is OptionIndex of the settings """
+        # This is used as in IAR template, everything is as an array with random positions
+        if name not in settings:
+            raise RuntimeError("Settings %s are not in the IAR template" % name)
+        return settings.nested(name, 'data', 'option')
+
+    def _check_options(self, options, *names):
+        """ Raises if an option is not in the template """
+        for name in names:
+            if name not in options:
+                raise RuntimeError("Option %s is not in the IAR template" % name)
 
     def _set_multiple_option(self, settings, value_list):
         settings['state'] = []
         for value in value_list:
             settings['state'].append(value)
 
-    def _ewp_general_set(self, ewp_dic, project_dic):
-        index_general = self._get_option(ewp_dic, 'General')
-        index_option = self._get_option(ewp_dic[index_general]['data']['option'], 'ExePath')
-        self._set_option(ewp_dic[index_general]['data']['option'][index_option], join('$PROJ_DIR$', project_dic['build_dir'], 'Exe'))
-        index_option = self._get_option(ewp_dic[index_general]['data']['option'], 'ObjPath')
-        self._set_option(ewp_dic[index_general]['data']['option'][index_option], join('$PROJ_DIR$', project_dic['build_dir'], 'Obj'))
-        index_option = self._get_option(ewp_dic[index_general]['data']['option'], 'ListPath')
-        self._set_option(ewp_dic[index_general]['data']['option'][index_option], join('$PROJ_DIR$', project_dic['build_dir'], 'List'))
-        index_option = self._get_option(ewp_dic[index_general]['data']['option'], 'GOutputBinary')
-        self._set_option(ewp_dic[index_general]['data']['option'][index_option], 0 if project_dic['output_type'] == 'exe' else 1)
-
-    def _ewp_iccarm_set(self, ewp_dic, project_dic):
+    def _ewp_general_set(self, ewp_settings, project_dic):
+        general = self._get_options(ewp_settings, 'General')
+        general.set('ExePath', join('$PROJ_DIR$', project_dic['build_dir'], 'Exe'))
+        general.set('ObjPath', join('$PROJ_DIR$', project_dic['build_dir'], 'Obj'))
+        general.set('ListPath', join('$PROJ_DIR$', project_dic['build_dir'], 'List'))
+        general.set('GOutputBinary', 0 if project_dic['output_type'] == 'exe' else 1)
+
+    def _ewp_iccarm_set(self, ewp_settings, project_dic):
         """ C/C++ options (ICCARM) """
-        index_iccarm = self._get_option(ewp_dic, 'ICCARM')
-        index_option = self._get_option(ewp_dic[index_iccarm]['data']['option'], 'CCDefines')
-        self._set_multiple_option(ewp_dic[index_iccarm]['data']['option'][index_option], project_dic['macros'])
-        index_option = self._get_option(ewp_dic[index_iccarm]['data']['option'], 'CCIncludePath2')
-        self._set_multiple_option(ewp_dic[index_iccarm]['data']['option'][index_option], project_dic['include_paths'])
+        iccarm = self._get_options(ewp_settings, 'ICCARM')
+        self._set_multiple_option(iccarm['CCDefines'], project_dic['macros'])
+        self._set_multiple_option(iccarm['CCIncludePath2'], project_dic['include_paths'])
 
-        iccarm_dic = ewp_dic[index_iccarm]['data']['option']
-        self._ewp_flags_set(iccarm_dic, project_dic, 'cxx_flags', self.FLAG_TO_IAR['cxx_flags'])
-        self._ewp_flags_set(iccarm_dic, project_dic, 'c_flags', self.FLAG_TO_IAR['c_flags'])
+        self._ewp_flags_set(iccarm, project_dic, 'cxx_flags', self.FLAG_TO_IAR['cxx_flags'])
+        self._ewp_flags_set(iccarm, project_dic, 'c_flags', self.FLAG_TO_IAR['c_flags'])
 
-    def _ewp_aarm_set(self, ewp_dic, project_dic):
+    def _ewp_aarm_set(self, ewp_settings, project_dic):
         """ Assembly options (AARM) """
-        index_aarm = self._get_option(ewp_dic, 'AARM')
-
-        aarm_dic = ewp_dic[index_aarm]['data']['option']
-        self._ewp_flags_set(aarm_dic, project_dic, 'asm_flags', self.FLAG_TO_IAR['asm_flags'])
+        aarm = self._get_options(ewp_settings, 'AARM')
+        self._ewp_flags_set(aarm, project_dic, 'asm_flags', self.FLAG_TO_IAR['asm_flags'])
 
-    def _ewp_ilink_set(self, ewp_dic, project_dic):
+    def _ewp_ilink_set(self, ewp_settings, project_dic):
         """ Linker options (ILINK) """
-        index_ilink = self._get_option(ewp_dic, 'ILINK')
-        index_option = self._get_option(ewp_dic[index_ilink]['data']['option'], 'IlinkIcfFile')
-        self._set_option(ewp_dic[index_ilink]['data']['option'][index_option], project_dic['linker_file'])
+        ilink = self._get_options(ewp_settings, 'ILINK')
+        ilink.set('IlinkIcfFile', project_dic['linker_file'])
 
-        ilink_dic = ewp_dic[index_ilink]['data']['option']
-        self._ewp_flags_set(ilink_dic, project_dic, 'ld_flags', self.FLAG_TO_IAR['ld_flags'])
+        self._ewp_flags_set(ilink, project_dic, 'ld_flags', self.FLAG_TO_IAR['ld_flags'])
 
-    def _ewp_flags_set(self, ewp_dic_subset, project_dic, flag_type, flag_dic):
+    def _ewp_flags_set(self, options, project_dic, flag_type, flag_dic):
         """ Flags from misc to set to ewp project """
         try:
-            if flag_type in project_dic['misc'].keys():
-                # enable commands
-                index_option = self._get_option(ewp_dic_subset, flag_dic['enable'])
-                self._set_option(ewp_dic_subset[index_option], '1')
-
-                index_option = self._get_option(ewp_dic_subset, flag_dic['set'])
-                if type(ewp_dic_subset[index_option]['state']) != list:
-                    # if it's string, only one state
-                    previous_state = ewp_dic_subset[index_option]['state']
-                    ewp_dic_subset[index_option]['state'] = []
-                    ewp_dic_subset[index_option]['state'].append(previous_state)
-
-                for item in project_dic['misc'][flag_type]:
-                    ewp_dic_subset[index_option]['state'].append(item)
+            flags = project_dic['misc'][flag_type]
         except KeyError:
             return
+        self._check_options(options, flag_dic['enable'], flag_dic['set'])
+        # enable commands
+        options.set(flag_dic['enable'], '1')
+
+        option = options[flag_dic['set']]
+        if type(option['state']) != list:
+            # if it's string, only one state
+            option['state'] = [option['state']]
+
+        for item in flags:
+            option['state'].append(item)
 
     def _ewp_files_set(self, ewp_dic, project_dic):
         """ Fills files in the ewp dictionary """
@@ -181,7 +172,7 @@ class IAREmbeddedWorkbenchProject:
         ewp_dic['project']['group'] = []
         i = 0
         for group_name, files in project_dic['groups'].items():
-            ewp_dic['project']['group'].append({'name': group_name, 'file': []})
+            ewp_dic['project']['group'].append(OrderedDict([('name', group_name), ('file', [])]))
             for file in files:
                 ewp_dic['project']['group'][i]['file'].append({'name': file})
             ewp_dic['project']['group'][i]['file'] = sorted(ewp_dic['project']['group'][i]['file'], key=lambda x: os.path.basename(x['name'].lower()))
@@ -232,16 +223,13 @@ class IAREmbeddedWorkbenchProject:
                 destination = os.path.join(os.path.relpath(os.getcwd(), path_workspace), project['files']['ewp'])
             eww_dic['workspace']['project'].append( { 'path' : join('$WS_DIR$', destination) })
 
-    def _ewp_set_target(self, ewp_dic, mcu_def_dic):
-        index_general = self._get_option(ewp_dic, 'General')
-        index_option = self._get_option(ewp_dic[index_general]['data']['option'], 'OGChipSelectEditMenu')
-        self._set_option(ewp_dic[index_general]['data']['option'][index_option], mcu_def_dic['OGChipSelectEditMenu']['state'])
-        index_option = self._get_option(ewp_dic[index_general]['data']['option'], 'OGCoreOrChip')
-        self._set_option(ewp_dic[index_general]['data']['option'][index_option], mcu_def_dic['OGCoreOrChip']['state'])
+    def _ewp_set_target(self, ewp_settings, mcu_def_dic):
+        general = self._get_options(ewp_settings, 'General')
+        general.set('OGChipSelectEditMenu', mcu_def_dic['OGChipSelectEditMenu']['state'])
+        general.set('OGCoreOrChip', mcu_def_dic['OGCoreOrChip']['state'])
 
         # get version based on FPU
-        index_option = self._get_option(ewp_dic[index_general]['data']['option'], 'FPU2')
-        if index_option == None:
+        if 'FPU2' not in general:
             fileVersion = 1
         else:
             fileVersion = 2
@@ -262,42 +250,39 @@ class IAREmbeddedWorkbenchProject:
         GBECoreSlave = _get_mcu_option('GBECoreSlave')
 
         if fileVersion == 1:
-            index_option = self._get_option(ewp_dic[index_general]['data']['option'], 'Variant')
-            self._set_option(ewp_dic[index_general]['data']['option'][index_option], Variant)
-            index_option = self._get_option(ewp_dic[index_general]['data']['option'], 'GFPUCoreSlave')
-            self._set_option(ewp_dic[index_general]['data']['option'][index_option], GFPUCoreSlave)
+            general.set('Variant', Variant)
+            general.set('GFPUCoreSlave', GFPUCoreSlave)
         elif fileVersion == 2:
-            index_option = self._get_option(ewp_dic[index_general]['data']['option'], 'CoreVariant')
-            self._set_option(ewp_dic[index_general]['data']['option'][index_option], Variant)
-            index_option = self._get_option(ewp_dic[index_general]['data']['option'], 'GFPUCoreSlave2')
-            self._set_option(ewp_dic[index_general]['data']['option'][index_option], GFPUCoreSlave)
+            general.set('CoreVariant', Variant)
+            general.set('GFPUCoreSlave2', GFPUCoreSlave)
             if GBECoreSlave:
-                index_option = self._get_option(ewp_dic[index_general]['data']['option'], 'GBECoreSlave')
-                self._set_option(ewp_dic[index_general]['data']['option'][index_option], mcu_def_dic['GBECoreSlave']['state'])
+                general.set('GBECoreSlave', mcu_def_dic['GBECoreSlave']['state'])
             GFPUDeviceSlave = {
                 'state': mcu_def_dic['OGChipSelectEditMenu']['state'], # should be same
                 'name': 'GFPUDeviceSlave',
             }
-            ewp_dic[index_general]['data']['option'].append(GFPUDeviceSlave)
+            general.append(GFPUDeviceSlave)
 
-    def _ewd_set_debugger(self, ewd_dic, debugger):
+    def _ewd_set_debugger(self, ewd_settings, debugger):
         try:
             debugger_def = self.definitions.debuggers[debugger['name']]
         except TypeError:
             return
-        index_cspy = self._get_option(ewd_dic, 'C-SPY')
-        index_option = self._get_option(ewd_dic[index_cspy]['data']['option'], 'OCDynDriverList')
-        self._set_option(ewd_dic[index_cspy]['data']['option'][index_option], debugger_def['OCDynDriverList']['state'])
+        cspy = self._get_options(ewd_settings, 'C-SPY')
+        self._check_options(cspy, 'OCDynDriverList')
+        cspy.set('OCDynDriverList', debugger_def['OCDynDriverList']['state'])
 
         # find InterfaceRadio (jtag or swd)
         try:
-            debugger_interface = self.definitions.debuggers[debugger['name']]['interface']
-            index_debugger_settings = self._get_option(ewd_dic, debugger_def['OCDynDriverList']['state'])
-            index_option = self._get_option(ewd_dic[index_debugger_settings]['data']['option'], debugger_interface['name'])
-            self._set_option(ewd_dic[index_debugger_settings]['data']['option'][index_option], debugger_def['interface'][debugger['interface']])
-        except TypeError as e:
+            debugger_interface = debugger_def['interface']
+            interface = debugger_interface[debugger['interface']]
+        except (TypeError, KeyError):
             # use default
-            pass
+            return
+        debugger_settings = self._get_options(ewd_settings, debugger_def['OCDynDriverList']['state'])
+        self._check_options(debugger_settings, debugger_interface['name'])
+        debugger_settings.set(debugger_interface['name'], interface)
+
         
 class IAREmbeddedWorkbench(Tool, Builder, Exporter, IAREmbeddedWorkbenchProject):
 
@@ -310,6 +295,9 @@ class IAREmbeddedWorkbench(Tool, Builder, Exporter, IAREmbeddedWorkbenchProject)
         }
     }
 
+    # files are set by _ewp_files_set, not loaded from templates
+    EWP_SKIPPED = [('project', 'file'), ('project', 'group')]
+
     def __init__(self, workspace, env_settings):
         self.definitions = IARDefinitions()
         self.workspace = workspace
@@ -354,8 +342,8 @@ class IAREmbeddedWorkbench(Tool, Builder, Exporter, IAREmbeddedWorkbenchProject)
         data['groups'] = OrderedDict(sorted(data['groups'].items(), key=lambda t: t[0]))
 
     def _get_default_templates(self):
-        ewp_dic = xmltodict.parse(open(self.ewp_file).read())
-        ewd_dic = xmltodict.parse(open(self.ewd_file).read())
+        ewp_dic = parse_xml(self.ewp_file, skip=self.EWP_SKIPPED)
+        ewd_dic = parse_xml(self.ewd_file)
         return ewp_dic, ewd_dic
 
     def _export_single_project(self):
@@ -374,18 +362,18 @@ class IAREmbeddedWorkbench(Tool, Builder, Exporter, IAREmbeddedWorkbenchProject)
                 # we support .ewp or .ewp.tmpl templates
                 if os.path.splitext(template)[1] == '.ewp' or re.match('.*\.ewp.tmpl$', template):
                     try:
-                        ewp_dic = xmltodict.parse(open(template), dict_constructor=dict)
+                        ewp_dic = parse_xml(template, dict_constructor=dict, skip=self.EWP_SKIPPED)
                         template_ewp = True
                     except IOError:
                         logger.info("Template file %s not found" % template)
-                        ewp_dic = xmltodict.parse(open(self.ewp_file).read())
+                        ewp_dic = parse_xml(self.ewp_file, skip=self.EWP_SKIPPED)
                 if os.path.splitext(template)[1] == '.ewd' or re.match('.*\.ewd.tmpl$', template):
                     try:
-                        ewd_dic = xmltodict.parse(open(template), dict_constructor=dict)
+                        ewd_dic = parse_xml(template, dict_constructor=dict)
                         template_ewd = True
                     except IOError:
                         logger.info("Template file %s not found" % template)
-                        ewd_dic = xmltodict.parse(open(self.ewd_file).read())
+                        ewd_dic = parse_xml(self.ewd_file)
                 # handle non valid template files or not specified
                 if not template_ewp and template_ewd:
                     ewp_dic, _ = self._get_default_templates() 
@@ -401,19 +389,19 @@ class IAREmbeddedWorkbench(Tool, Builder, Exporter, IAREmbeddedWorkbenchProject)
                 template = join(getcwd(), template)
                 if os.path.splitext(template)[1] == '.ewp' or re.match('.*\.ewp.tmpl$', template):
                     try:
-                        ewp_dic = xmltodict.parse(open(template), dict_constructor=dict)
+                        ewp_dic = parse_xml(template, dict_constructor=dict, skip=self.EWP_SKIPPED)
                         template_ewp = True
                     except IOError:
                         logger.info("Template file %s not found" % template)
-                        ewp_dic = xmltodict.parse(open(self.ewp_file).read())
+                        ewp_dic = parse_xml(self.ewp_file, skip=self.EWP_SKIPPED)
                 if os.path.splitext(template)[1] == '.ewd' or re.match('.*\.ewd.tmpl$', template):
                     # get ewd template
                     try:
-                        ewd_dic = xmltodict.parse(open(template), dict_constructor=dict)
+                        ewd_dic = parse_xml(template, dict_constructor=dict)
                         template_ewd = True
                     except IOError:
                         logger.info("Template file %s not found" % template)
-                        ewd_dic = xmltodict.parse(open(self.ewd_file).read())
+                        ewd_dic = parse_xml(self.ewd_file)
                 # handle non valid template files or not specified
                 if not template_ewp and template_ewd:
                     ewp_dic, _ = self._get_default_templates() 
@@ -428,11 +416,10 @@ class IAREmbeddedWorkbench(Tool, Builder, Exporter, IAREmbeddedWorkbenchProject)
         if self.workspace['singular']:
             # TODO 0xc0170: if we use here self.definitions.eww, travis fails. I cant reproduce it and dont see
             # eww used anywhere prior to exporting this.
-            eww_dic = {u'workspace': {u'project': {u'path': u''}, u'batchBuild': None}}
+            eww_dic = {u'workspace': OrderedDict([(u'project', {u'path': u''}), (u'batchBuild', None)])}
             # set eww
             self._eww_set_path_single_project(eww_dic, expanded_dic['name'])
-            eww_xml = xmltodict.unparse(eww_dic, pretty=True)
-            project_path, eww = self.gen_file_raw(eww_xml, '%s.eww' % expanded_dic['name'], expanded_dic['output_dir']['path'])
+            project_path, eww = self.gen_file_xml(eww_dic, '%s.eww' % expanded_dic['name'], expanded_dic['output_dir']['path'], pretty=True)
 
 
         try:
@@ -462,29 +449,31 @@ class IAREmbeddedWorkbench(Tool, Builder, Exporter, IAREmbeddedWorkbenchProject)
         self._ewp_set_toolchain(ewp_configuration, 'ARM')
 
         # set common things we have for IAR
-        self._ewp_general_set(ewp_configuration['settings'], expanded_dic)
-        self._ewp_iccarm_set(ewp_configuration['settings'], expanded_dic)
-        self._ewp_aarm_set(ewp_configuration['settings'], expanded_dic)
-        self._ewp_ilink_set(ewp_configuration['settings'], expanded_dic)
+        ewp_settings = OptionIndex(ewp_configuration['settings'])
+        ewd_settings = OptionIndex(ewd_dic['project']['configuration']['settings'])
+        self._ewp_general_set(ewp_settings, expanded_dic)
+        self._ewp_iccarm_set(ewp_settings, expanded_dic)
+        self._ewp_aarm_set(ewp_settings, expanded_dic)
+        self._ewp_ilink_set(ewp_settings, expanded_dic)
         self._ewp_files_set(ewp_dic, expanded_dic)
 
         # set target only if defined, otherwise use from template/default one
         if expanded_dic['target']:
             # get target definition (target + mcu)
-            proj_def = ProGenDef('iar')
-            if not proj_def.is_supported(expanded_dic['target'].lower()):
+            proj_def = get_target_definitions()
+            if not proj_def.is_supported(expanded_dic['target'].lower(), 'iar'):
                 raise RuntimeError("Target %s is not supported." % expanded_dic['target'].lower())
-            mcu_def_dic = proj_def.get_tool_definition(expanded_dic['target'].lower())
+            mcu_def_dic = proj_def.get_tool_definition(expanded_dic['target'].lower(), 'iar')
             if not mcu_def_dic:
                  raise RuntimeError(
                     "Mcu definitions were not found for %s. Please add them to https://github.com/project-generator/project_generator_definitions" % expanded_dic['target'].lower())
             self._normalize_mcu_def(mcu_def_dic)
             logger.debug("Mcu definitions: %s" % mcu_def_dic)
-            self._ewp_set_target(ewp_configuration['settings'], mcu_def_dic)
+            self._ewp_set_target(ewp_settings, mcu_def_dic)
 
             try:
                 debugger = proj_def.get_debugger(expanded_dic['target'])
-                self._ewd_set_debugger(ewd_dic['project']['configuration']['settings'], debugger)
+                self._ewd_set_debugger(ewd_settings, debugger)
             except KeyError as err:
                 # TODO: worth reporting?
                 pass
@@ -492,27 +481,25 @@ class IAREmbeddedWorkbench(Tool, Builder, Exporter, IAREmbeddedWorkbenchProject)
         # overwrite debugger only if defined in the project file, otherwise use either default or from template
         if expanded_dic['debugger']:
             try:
-                self._ewd_set_debugger(ewd_dic['project']['configuration']['settings'], expanded_dic['debugger'])
+                self._ewd_set_debugger(ewd_settings, expanded_dic['debugger'])
             except KeyError:
                 raise RuntimeError("Debugger %s is not supported" % expanded_dic['debugger'])
 
         self._ewd_set_name(ewd_dic['project']['configuration'], expanded_dic['name'])
 
         # IAR uses ident 2 spaces, encoding iso-8859-1
-        ewp_xml = xmltodict.unparse(ewp_dic, encoding='iso-8859-1', pretty=True, indent='  ')
-        project_path, ewp = self.gen_file_raw(ewp_xml, '%s.ewp' % expanded_dic['name'], expanded_dic['output_dir']['path'])
-
-        ewd_xml = xmltodict.unparse(ewd_dic, encoding='iso-8859-1', pretty=True, indent='  ')
-        project_path, ewd = self.gen_file_raw(ewd_xml, '%s.ewd' % expanded_dic['name'], expanded_dic['output_dir']['path'])
+        project_path, ewp = self.gen_file_xml(ewp_dic, '%s.ewp' % expanded_dic['name'], expanded_dic['output_dir']['path'],
+                                              encoding='iso-8859-1', pretty=True, indent='  ')
+        project_path, ewd = self.gen_file_xml(ewd_dic, '%s.ewd' % expanded_dic['name'], expanded_dic['output_dir']['path'],
+                                              encoding='iso-8859-1', pretty=True, indent='  ')
         return project_path, [ewp, eww, ewd]
 
     def _generate_eww_file(self):
-        eww_dic = xmltodict.parse(open(self.eww_file).read())
+        eww_dic = parse_xml(self.eww_file)
         self._eww_set_path_multiple_project(eww_dic)
 
         # generate the file
-        eww_xml = xmltodict.unparse(eww_dic, pretty=True)
-        project_path, eww = self.gen_file_raw(eww_xml, '%s.eww' % self.workspace['settings']['name'], self.workspace['settings']['path'])
+        project_path, eww = self.gen_file_xml(eww_dic, '%s.eww' % self.workspace['settings']['name'], self.workspace['settings']['path'], pretty=True)
         return project_path, [eww]
 
     def _parse_subprocess_output(self, output):
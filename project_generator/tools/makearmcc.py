@@ -35,6 +35,7 @@ class MakefileArmcc(MakefileTool):
     def export_project(self):
         """ Processes misc options specific for GCC ARM, and run generator """
         generated_projects = deepcopy(self.generated_projects)
-        self.process_data_for_makefile(self.workspace)
-        generated_projects['path'], generated_projects['files']['makefile'] = self.gen_file_jinja('makefile_armcc.tmpl', self.workspace, 'Makefile', self.workspace['output_dir']['path'])
+        data_for_make = self.workspace.copy()
+        self.process_data_for_makefile(data_for_make)
+        generated_projects['path'], generated_projects['files']['makefile'] = self.gen_file_jinja('makefile_armcc.tmpl', data_for_make, 'Makefile', data_for_make['output_dir']['path'])
         return generated_projects
@@ -57,11 +57,10 @@ class MakefileTool(Tool, Exporter):
         data['c_flags'] = []
         data['cxx_flags'] = []
         data['asm_flags'] = []
-        for k, v in data['misc'].items():
+        for k, v in sorted(data['misc'].items()):
             if type(v) is list:
-                if k not in data:
-                    data[k] = []
-                data[k].extend(v)
+                # a new list, the project data might share the one in data
+                data[k] = data.get(k, []) + v
             else:
                 if k not in data:
                     data[k] = ''
@@ -90,7 +89,7 @@ class MakefileTool(Tool, Exporter):
     def process_data_for_makefile(self, project_data):
         #Flatten our dictionary, we don't need groups
         for key in SOURCE_KEYS:
-            project_data[key] = list(chain(*project_data[key].values()))
+            project_data[key] = list(chain(*[v for k, v in sorted(project_data[key].items())]))
         self._get_libs(project_data)
         self._parse_specific_options(project_data)
 
@@ -46,17 +46,18 @@ class SublimeTextMakeGccARM(MakefileGccArm):
     def export_project(self):
         """ Processes misc options specific for GCC ARM, and run generator. """
         output = copy.deepcopy(self.generated_project)
-        self.process_data_for_makefile(self.workspace)
-        self._fix_sublime_paths(self.workspace)
-        self.workspace['linker_options'] =[]
+        data_for_make = self.workspace.copy()
+        self.process_data_for_makefile(data_for_make)
+        self._fix_sublime_paths(data_for_make)
+        data_for_make['linker_options'] =[]
 
-        output['path'], output['files']['makefile'] = self.gen_file_jinja('makefile_gcc.tmpl', self.workspace, 'Makefile', self.workspace['output_dir']['path'])
+        output['path'], output['files']['makefile'] = self.gen_file_jinja('makefile_gcc.tmpl', data_for_make, 'Makefile', data_for_make['output_dir']['path'])
 
-        self.workspace['buildsys_name'] = 'Make'
-        self.workspace['buildsys_cmd'] = 'make all'
+        data_for_make['buildsys_name'] = 'Make'
+        data_for_make['buildsys_cmd'] = 'make all'
 
         path, output['files']['sublimetext'] = self.gen_file_jinja(
-            'sublimetext.sublime-project.tmpl', self.workspace, '%s.sublime-project' % self.workspace['name'], self.workspace['output_dir']['path'])
+            'sublimetext.sublime-project.tmpl', data_for_make, '%s.sublime-project' % data_for_make['name'], data_for_make['output_dir']['path'])
         generated_projects = output
         return generated_projects
 
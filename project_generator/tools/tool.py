@@ -13,17 +13,298 @@
 # limitations under the License.
 
 import os
+import inspect
+import hashlib
 import logging
+import threading
+import xmltodict
 from collections import OrderedDict
+from xml.parsers import expat
+from xml.sax.saxutils import escape, quoteattr
 
 from os.path import join, dirname, abspath, normpath
-from jinja2 import Template, FileSystemLoader
+from jinja2 import Template, FileSystemLoader, FileSystemBytecodeCache
 from jinja2.environment import Environment
 
 from ..util import SOURCE_KEYS
+from ..sinks import FileSink
+from ..settings import ProjectSettings
+from ..template_loader import PrecompiledLoader
+from ..util import makedirs
+
+try:
+    _text_type = unicode
+except NameError:
+    _text_type = str
 
 logger = logging.getLogger('progen.tools')
 
+TEMPLATE_DIR = abspath(join(dirname(__file__), '..', 'templates'))
+
+_jinja_env = None
+
+def get_jinja_environment():
+    """ The process wide jinja2 environment, loaded templates are cached.
+
+    Templates compiled when the package was built are used if up to date. Otherwise
+    compiled templates are stored in the progen cache directory, jinja2 invalidates
+    them by the checksum of the template source.
+    """
+    global _jinja_env
+    if _jinja_env is None:
+        bytecode_cache = None
+        cache_dir = join(ProjectSettings.CACHE_DIR, 'jinja2')
+        try:
+            makedirs(cache_dir)
+            bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        except OSError:
+            logger.debug("Templates bytecode cache %s is not accessible" % cache_dir)
+        # TODO: undefined=StrictUndefined - this needs fixes in templates
+        _jinja_env = Environment(loader=PrecompiledLoader(TEMPLATE_DIR), bytecode_cache=bytecode_cache)
+    return _jinja_env
+
+# exporter class -> digest of its code and templates
+_exporter_digests = {}
+
+def get_exporter_digest(exporter):
+    """ Digest of the modules defining the exporter (and its base classes), of the helper
+    modules of the package and of the internal templates. It changes when the exporter
+    might write different files for the same data, computed once per process """
+    if exporter not in _exporter_digests:
+        package_dir = dirname(TEMPLATE_DIR)
+        paths = set(join(package_dir, name) for name in os.listdir(package_dir) if name.endswith('.py'))
+        for cls in inspect.getmro(exporter):
+            try:
+                paths.add(inspect.getsourcefile(cls))
+            except TypeError:
+                # built-in classes
+                pass
+        for root, dirs, names in os.walk(TEMPLATE_DIR):
+            paths.update(join(root, name) for name in names)
+        digest = hashlib.sha1()
+        for path in sorted(p for p in paths if p):
+            digest.update(os.path.relpath(path, package_dir).encode('utf-8'))
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        _exporter_digests[exporter] = digest.hexdigest()
+    return _exporter_digests[exporter]
+
+# parsed xml files, (path, dict_constructor, encoding, skip) -> (mtime, size, tree)
+_xml_cache = {}
+_xml_cache_lock = threading.Lock()
+
+class _SkippingExpat(object):
+    """ Used as the expat module by xmltodict.parse, content of elements at the skipped
+    paths is not passed to xmltodict, these elements are loaded empty (None) """
+
+    def __init__(self, skip):
+        self.skip = skip
+
+    def ParserCreate(self, *args):
+        return _SkippingParser(expat.ParserCreate(*args), self.skip)
+
+class _SkippingParser(object):
+
+    HANDLERS = ['StartElementHandler', 'EndElementHandler', 'CharacterDataHandler']
+
+    def __init__(self, parser, skip):
+        self.__dict__.update(parser=parser, skip=skip, path=[], skip_depth=None, handlers={})
+        parser.StartElementHandler = self._start
+        parser.EndElementHandler = self._end
+        parser.CharacterDataHandler = self._characters
+
+    def __getattr__(self, name):
+        return getattr(self.parser, name)
+
+    def __setattr__(self, name, value):
+        if name in self.HANDLERS:
+            self.handlers[name] = value
+        elif name in self.__dict__:
+            self.__dict__[name] = value
+        else:
+            setattr(self.parser, name, value)
+
+    def _start(self, name, attrs):
+        self.path.append(name)
+        if self.skip_depth is None:
+            if tuple(self.path) in self.skip:
+                self.skip_depth = len(self.path)
+            self.handlers['StartElementHandler'](name, attrs)
+
+    def _end(self, name):
+        depth = len(self.path)
+        self.path.pop()
+        if self.skip_depth is not None:
+            if depth > self.skip_depth:
+                return
+            self.skip_depth = None
+        self.handlers['EndElementHandler'](name)
+
+    def _characters(self, data):
+        if self.skip_depth is None:
+            self.handlers['CharacterDataHandler'](data)
+
+def _clone_tree(node):
+    # xmltodict trees contain only dictionaries, lists and strings, much faster than deepcopy
+    if isinstance(node, dict):
+        return type(node)((key, _clone_tree(value)) for key, value in node.items())
+    if isinstance(node, list):
+        return [_clone_tree(item) for item in node]
+    return node
+
+def parse_xml(path, dict_constructor=OrderedDict, encoding=None, skip=()):
+    """ xmltodict.parse of the file, each file is parsed once per process (again if modified).
+
+    skip is a list of element paths (tuples of names from the root), these elements are
+    kept in the tree but their content is not loaded. Exporters use it for sections which
+    they replace anyway, like files in large templates.
+
+    Returns a copy of the parsed tree, the caller is free to modify it. Raises IOError
+    if the file can't be opened.
+    """
+    skip = frozenset(tuple(element) for element in skip)
+    key = (os.path.abspath(path), dict_constructor, encoding, skip)
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        with _xml_cache_lock:
+            entry = _xml_cache.get(key)
+        if entry is None or entry[:2] != (stat.st_mtime, stat.st_size):
+            tree = xmltodict.parse(f, encoding=encoding, dict_constructor=dict_constructor,
+                                   expat=_SkippingExpat(skip) if skip else expat)
+            entry = (stat.st_mtime, stat.st_size, tree)
+            with _xml_cache_lock:
+                _xml_cache[key] = entry
+    return _clone_tree(entry[2])
+
+def _emit_xml_element(key, node, depth, stack, encoding, pretty, indent, newl):
+    # opening tag of the element, what follows is pushed to the stack (reversed)
+    if node is None:
+        node = OrderedDict()
+    elif isinstance(node, bool):
+        node = u'true' if node else u'false'
+    elif not isinstance(node, dict):
+        node = _text_type(node)
+    if not isinstance(node, dict):
+        node = {'#text': node}
+    cdata = None
+    attrs = []
+    children = []
+    for child_key, child in node.items():
+        if child_key == '#text':
+            cdata = child
+        elif child_key.startswith('@'):
+            if child_key == '@xmlns' and isinstance(child, dict):
+                for prefix, uri in child.items():
+                    attrs.append((u'xmlns:%s' % prefix if prefix else u'xmlns', _text_type(uri)))
+            else:
+                attrs.append((child_key[1:], child if isinstance(child, _text_type) else _text_type(child)))
+        else:
+            children.append((child_key, child))
+
+    head = [indent * depth if pretty else u'', u'<', key]
+    for name, value in attrs:
+        head.append(u' %s=%s' % (name, quoteattr(value)))
+    head.append(u'>')
+    if pretty and children:
+        head.append(newl)
+
+    tail = []
+    if cdata is not None:
+        if not isinstance(cdata, _text_type):
+            cdata = _text_type(cdata, encoding)
+        tail.append(escape(cdata))
+    if pretty and children:
+        tail.append(indent * depth)
+    tail.append(u'</%s>' % key)
+    if pretty and depth:
+        tail.append(newl)
+    stack.append(u''.join(tail))
+    for child_key, child in reversed(children):
+        stack.append((child_key, child, depth + 1))
+    return u''.join(head)
+
+def unparse_xml(tree, encoding='utf-8', pretty=False, indent='\t', newl='\n', blocksize=65536):
+    """ Same output as xmltodict.unparse(tree, encoding=..., pretty=..., ...), generated in
+    text chunks of about blocksize. The tree is walked without recursion, large projects
+    are written while they are serialized. """
+    if len(tree) != 1:
+        raise ValueError('Document must have exactly one root.')
+    if encoding.lower().replace('_', '-') in ('utf-8', 'utf8'):
+        encode = None
+    else:
+        # characters not in the encoding are replaced by references, as XMLGenerator does
+        encode = lambda text: text.encode(encoding, 'xmlcharrefreplace').decode(encoding)
+    block = [u'<?xml version="1.0" encoding="%s"?>\n' % encoding]
+    length = 0
+    stack = [(key, value, 0) for key, value in tree.items()]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, tuple):
+            key, value, depth = item
+            if hasattr(value, '__iter__') and not isinstance(value, (dict, str, bytes, _text_type)):
+                value = list(value)
+                if depth == 0 and len(value) > 1:
+                    raise ValueError('document with multiple roots')
+                stack.extend((key, node, depth) for node in reversed(value))
+                continue
+            item = _emit_xml_element(key, value, depth, stack, encoding, pretty, indent, newl)
+        block.append(item)
+        length += len(item)
+        if length >= blocksize:
+            text = u''.join(block)
+            yield encode(text) if encode else text
+            block = []
+            length = 0
+    text = u''.join(block)
+    yield encode(text) if encode else text
+
+class OptionIndex(object):
+    """ Access by name to a list of option nodes, as IAR and CoIDE projects store
+    settings ([{'name': 'ExePath', 'state': ...}, ...]).
+
+    The list is indexed once, the first node wins if a name is repeated. Nodes are
+    modified in place, append nodes through the index to keep it valid.
+    """
+
+    def __init__(self, nodes, key='name'):
+        self.nodes = nodes
+        self.key = key
+        self.positions = {}
+        for position, node in enumerate(nodes):
+            self.positions.setdefault(node.get(key), position)
+        self.nested_indexes = {}
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def __getitem__(self, name):
+        return self.nodes[self.positions[name]]
+
+    def get(self, name, default=None):
+        position = self.positions.get(name)
+        return default if position is None else self.nodes[position]
+
+    def index(self, name):
+        """ Position of the node in the list, None if not found """
+        return self.positions.get(name)
+
+    def set(self, name, value, attribute='state'):
+        self[name][attribute] = value
+
+    def append(self, node):
+        self.positions.setdefault(node.get(self.key), len(self.nodes))
+        self.nodes.append(node)
+
+    def nested(self, name, *path, **kwargs):
+        """ OptionIndex of the list found at path within the node, created once """
+        key = (name,) + path
+        if key not in self.nested_indexes:
+            nodes = self[name]
+            for element in path:
+                nodes = nodes[element]
+            self.nested_indexes[key] = OptionIndex(nodes, kwargs.get('key', self.key))
+        return self.nested_indexes[key]
+
 
 def get_tool_template():
     """ Internal project data
@@ -72,19 +353,20 @@ def get_tool_template():
             'rel_path': '',
             'rel_count': '',
         },
-        "macros": {
-            "common" : [],
-            "asm" : [],
-            "c" : [],
-            "cxx" : []
-            },
-        "flags": {
-            "common" : [],
-            "asm" : [],
-            "c" : [],
-            "cxx" : [],
-            "ld" : []
-            },
+        # ordered, exporters emit macros and flags in this order
+        "macros": OrderedDict([
+            ("common", []),
+            ("asm", []),
+            ("c", []),
+            ("cxx", []),
+            ]),
+        "flags": OrderedDict([
+            ("common", []),
+            ("asm", []),
+            ("c", []),
+            ("cxx", []),
+            ("ld", []),
+            ]),
         "template": None,
         "misc": {}        
     }
@@ -119,7 +401,14 @@ class Builder:
 class Exporter(object):
     """Just an exporter template for subclassing"""
 
-    TEMPLATE_DIR = abspath(join(dirname(__file__), '..', 'templates'))
+    TEMPLATE_DIR = TEMPLATE_DIR
+
+    # list of files written by the exporter, set by the project to record them
+    outputs = None
+    # where generated files are written (sinks.Sink), the filesystem by default
+    sink = None
+    # generated files contain the working directory (absolute paths)
+    embeds_cwd = False
 
     # Any tool which exports should implement these methods 3 methods
     def export_workspace(self):
@@ -143,30 +432,39 @@ class Exporter(object):
     # tool provides.
 
     def gen_file_raw(self, target_text, output, dest_path):
-        if not os.path.exists(dest_path):
-            os.makedirs(dest_path)
         output = join(dest_path, output)
-        logger.debug("Generating: %s" % output)
+        self._write_output(output, [target_text])
+        return dirname(output), output
 
-        open(output, "w").write(target_text)
+    def gen_file_xml(self, tree, output, dest_path, **kwargs):
+        """ Serializes xmltodict tree to the output, kwargs as for xmltodict.unparse """
+        output = join(dest_path, output)
+        self._write_output(output, unparse_xml(tree, **kwargs))
         return dirname(output), output
 
     def gen_file_jinja(self, template_file, data, output, dest_path):
-        if not os.path.exists(dest_path):
-            os.makedirs(dest_path)
+        """ Fills data to the project template, using jinja2. """
         output = join(dest_path, output)
-        logger.debug("Generating: %s" % output)
 
-        """ Fills data to the project template, using jinja2. """
-        env = Environment()
-        env.loader = FileSystemLoader(self.TEMPLATE_DIR)
-        # TODO: undefined=StrictUndefined - this needs fixes in templates
+        if self.TEMPLATE_DIR == TEMPLATE_DIR:
+            env = get_jinja_environment()
+        else:
+            env = Environment(loader=FileSystemLoader(self.TEMPLATE_DIR))
         template = env.get_template(template_file)
-        target_text = template.render(data)
 
-        open(output, "w").write(target_text)
+        # rendered text is written as it is generated, not kept in memory
+        self._write_output(output, template.generate(data))
         return dirname(output), output
 
+    def _write_output(self, output, chunks):
+        # all generated files are written here, unchanged files are not touched
+        if (self.sink or FileSink()).write_chunks(output, chunks):
+            logger.debug("Generating: %s" % output)
+        else:
+            logger.debug("Unchanged: %s" % output)
+        if self.outputs is not None:
+            self.outputs.append(output)
+
     def fixup_executable(self, exe_path):
         return exe_path
 
@@ -189,7 +487,7 @@ class Exporter(object):
                                                key=self._expand_sort_key)
 
     def _get_groups(self, data):
-        """ Get all groups defined """
+        """ Get all groups defined, sorted by name """
         groups = []
         for attribute in SOURCE_KEYS:
             for k, v in data[attribute].items():
@@ -202,10 +500,10 @@ class Exporter(object):
                 k = 'Includes'
             if k not in groups:
                 groups.append(k)
-        return groups
+        return sorted(groups)
     
     def _get_src_groups(self, data):
-        """ Get all groups defined """
+        """ Get all groups defined, sorted by name """
         groups = []
         for attribute in SOURCE_KEYS:
             for k, v in data[attribute].items():
@@ -213,7 +511,7 @@ class Exporter(object):
                     k = 'Sources'
                 if k not in groups:
                     groups.append(k)
-        return groups
+        return sorted(groups)
     
     def _iterate(self, data, expanded_data):
         """ _Iterate through all data, store the result expansion in extended dictionary """
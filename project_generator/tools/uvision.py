@@ -16,7 +16,6 @@ import os
 import subprocess
 import shutil
 import logging
-import xmltodict
 import copy
 import re
 from codecs import open
@@ -24,7 +23,7 @@ from codecs import open
 from os import getcwd
 from os.path import basename, join, normpath
 from collections import OrderedDict
-from .tool import Tool, Builder, Exporter
+from .tool import Tool, Builder, Exporter, parse_xml
 from ..util import fix_path
 
 logger = logging.getLogger('progen.tools.uvision')
@@ -157,6 +156,9 @@ class Uvision(Tool, Builder, Exporter):
     optimization_options = ['O0', 'O1', 'O2', 'O3']
     file_types = {'cpp': 8, 'c': 1, 's': 2, 'obj': 3,'o':3, 'lib': 4, 'ar': 4, 'h': 5}
 
+    # groups are set by _uvproj_files_set, not loaded from templates
+    UVPROJ_SKIPPED = [('Project', 'Targets', 'Target', 'Groups')]
+
     # flags mapping to uvision uvproj dics
     # for available flags, check armcc/armasm/armlink command line guide
     # this does not provide all options within a project, most usable options are
@@ -330,7 +332,7 @@ class Uvision(Tool, Builder, Exporter):
             i += 1
 
     def _generate_uvmpw_file(self):
-        uvmpw_dic = xmltodict.parse(open(self.uvmpw_file))
+        uvmpw_dic = parse_xml(self.uvmpw_file)
         uvmpw_dic['ProjectWorkspace']['project'] = []
 
         for project in self.workspace['projects']:
@@ -344,8 +346,7 @@ class Uvision(Tool, Builder, Exporter):
             uvmpw_dic['ProjectWorkspace']['project'].append({'PathAndName': destination})
 
         # generate the file
-        uvmpw_xml = xmltodict.unparse(uvmpw_dic, pretty=True)
-        project_path, uvmpw = self.gen_file_raw(uvmpw_xml, '%s.uvmpw' % self.workspace['settings']['name'], self.workspace['settings']['path'])
+        project_path, uvmpw = self.gen_file_xml(uvmpw_dic, '%s.uvmpw' % self.workspace['settings']['name'], self.workspace['settings']['path'], pretty=True)
         return project_path, uvmpw
 
     def _set_target(self, expanded_dic, uvproj_dic, tool_name):
@@ -423,13 +424,13 @@ class Uvision(Tool, Builder, Exporter):
                 if os.path.splitext(template)[1] == '.uvproj' or os.path.splitext(template)[1] == '.uvprojx' or \
                     re.match('.*\.uvproj.tmpl$', template) or re.match('.*\.uvprojx.tmpl$', template):
                     try:
-                        uvproj_dic = xmltodict.parse(open(template, encoding="utf8").read())
+                        uvproj_dic = parse_xml(template, encoding='utf-8', skip=self.UVPROJ_SKIPPED)
                     except IOError:
                         logger.info("Template file %s not found" % template)
                         return None, None
                 else:
                     logger.info("Template file %s contains unknown template extension (.uvproj/x are valid). Using default one" % template)
-                    uvproj_dic = xmltodict.parse(open(self.uvproj_file))
+                    uvproj_dic = parse_xml(self.uvproj_file, skip=self.UVPROJ_SKIPPED)
         elif 'uvision' in self.env_settings.templates.keys():
             # template overrides what is set in the yaml files
             for template in self.env_settings.templates['uvision']:
@@ -437,15 +438,15 @@ class Uvision(Tool, Builder, Exporter):
                 if os.path.splitext(template)[1] == '.uvproj' or os.path.splitext(template)[1] == '.uvprojx' or \
                     re.match('.*\.uvproj.tmpl$', template) or re.match('.*\.uvprojx.tmpl$', template):
                     try:
-                        uvproj_dic = xmltodict.parse(open(template, encoding="utf8").read())
+                        uvproj_dic = parse_xml(template, encoding='utf-8', skip=self.UVPROJ_SKIPPED)
                     except IOError:
                         logger.info("Template file %s not found. Using default template" % template)
-                        uvproj_dic = xmltodict.parse(open(self.uvproj_file))
+                        uvproj_dic = parse_xml(self.uvproj_file, skip=self.UVPROJ_SKIPPED)
                 else:
                     logger.info("Template file %s contains unknown template extension (.uvproj/x are valid). Using default one" % template)
-                    uvproj_dic = xmltodict.parse(open(self.uvproj_file))
+                    uvproj_dic = parse_xml(self.uvproj_file, skip=self.UVPROJ_SKIPPED)
         else:
-            uvproj_dic = xmltodict.parse(open(self.uvproj_file))
+            uvproj_dic = parse_xml(self.uvproj_file, skip=self.UVPROJ_SKIPPED)
 
         try:
             uvproj_dic['Project']['Targets']['Target']['TargetName'] = expanded_dic['name']
@@ -485,13 +486,12 @@ class Uvision(Tool, Builder, Exporter):
             except KeyError:
                 raise RuntimeError("Debugger %s is not supported" % expanded_dic['Debugger'])
         # Project file
-        uvproj_xml = xmltodict.unparse(uvproj_dic, pretty=True)
-        project_path, uvproj = self.gen_file_raw(uvproj_xml, '%s.%s' % (expanded_dic['name'], extension), expanded_dic['output_dir']['path'])
+        project_path, uvproj = self.gen_file_xml(uvproj_dic, '%s.%s' % (expanded_dic['name'], extension), expanded_dic['output_dir']['path'], pretty=True)
 
         uvoptx = None
 
         # generic tool template specified
-        uvoptx_dic = xmltodict.parse(open(self.uvoptx_file))
+        uvoptx_dic = parse_xml(self.uvoptx_file)
 
         self._uvoptx_set_debugger(expanded_dic, uvoptx_dic, tool_name)
 
@@ -504,8 +504,7 @@ class Uvision(Tool, Builder, Exporter):
         if tool_name == 'uvision5':
             uvoptx_dic['ProjectOpt']['xsi:noNamespaceSchemaLocation'] = 'project_optx.xsd'
         # Project file
-        uvoptx_xml = xmltodict.unparse(uvoptx_dic, pretty=True)            
-        project_path, uvoptx = self.gen_file_raw(uvoptx_xml, '%s.%s' % (expanded_dic['name'], extension), expanded_dic['output_dir']['path'])
+        project_path, uvoptx = self.gen_file_xml(uvoptx_dic, '%s.%s' % (expanded_dic['name'], extension), expanded_dic['output_dir']['path'], pretty=True)
 
         return project_path, [uvproj, uvoptx]
 
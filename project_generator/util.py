@@ -13,14 +13,31 @@
 
 import os
 import yaml
+import json
+import errno
+import binascii
 import locale
 import shutil
 import string
 import operator
+import hashlib
+import tempfile
 import copy
 import re
+import logging
 
 from functools import reduce
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
 
 FILES_EXTENSIONS = {
     'include_files': ['h', 'hpp', 'inc'],
@@ -36,6 +53,19 @@ FILE_MAP = {v:k for k,values in FILES_EXTENSIONS.items() for v in values}
 SOURCE_KEYS = ['source_files_c', 'source_files_s', 'source_files_cpp', 'source_files_lib', 'source_files_obj']
 VALID_EXTENSIONS = reduce(lambda x,y:x+y,[FILES_EXTENSIONS[key] for key in SOURCE_KEYS])
 
+logger = logging.getLogger('progen.util')
+
+# strategies to materialize a file in the copy mode
+COPY_MODES = ['copy', 'hardlink', 'symlink', 'reflink']
+# ioctl request to clone a file on linux filesystems with reflink support (btrfs, xfs)
+FICLONE = 0x40049409
+# copy mode state, stored in the destination directory
+SYNC_STATE_FILE = '.progen_copy.json'
+# portable files manifest, stored in the portable destination directory
+PORTABLE_MANIFEST_FILE = '.progen_portable.json'
+# advisory lock of a directory written by progen
+LOCK_FILE = '.progen.lock'
+
 def rmtree_if_exists(directory):
     if os.path.exists(directory):
         shutil.rmtree(directory)
@@ -199,3 +229,399 @@ def copytree(src, dst, ignore = None):
             errors.append((src, dst, str(why)))
     if errors:
         raise shutil.Error, errors
+
+
+def load_json(path, default=None):
+    """ Load a json file, default is returned if it does not exist or is not valid """
+    try:
+        with open(path, 'rt') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return default
+
+def dump_json(path, data):
+    write_file_if_changed(path, json.dumps(data, indent=1, sort_keys=True, separators=(',', ': ')))
+
+def _replace_file(src, dst):
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        try:
+            os.rename(src, dst)
+        except OSError:
+            # windows does not rename over an existing file
+            os.remove(dst)
+            os.rename(src, dst)
+
+def encode_text(text):
+    """ Generated text as written to files, utf-8 encoded with platform line endings """
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    if os.linesep != '\n':
+        text = text.replace(b'\n', os.linesep.encode('ascii'))
+    return text
+
+def _open_temp(path):
+    """ Temporary file next to the path, returns (file object, temporary path). It is created
+    as any new file, the umask applies to its permissions """
+    dirname = os.path.dirname(path) or '.'
+    if not os.path.exists(dirname):
+        makedirs(dirname)
+    for i in range(tempfile.TMP_MAX):
+        tmp = os.path.join(dirname, '.%s.%s.tmp' % (os.path.basename(path), binascii.hexlify(os.urandom(6)).decode('ascii')))
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                continue
+            raise
+        return os.fdopen(fd, 'wb'), tmp
+    raise IOError(errno.EEXIST, "No temporary file name is available for %s" % path)
+
+def _commit_temp(tmp, path):
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except OSError:
+        # a new file, created with the umask applied
+        mode = None
+    if mode is not None:
+        # an existing file keeps its permissions
+        os.chmod(tmp, mode)
+    _replace_file(tmp, path)
+
+def write_file_if_changed(path, text):
+    """ Write text to the file if its content differs, returns True if the file was written.
+
+    Unchanged files keep their mtime, so tools do not reload or rebuild them. The content
+    is written to a temporary file which then replaces the destination, readers never see
+    a partially written file. Text is encoded as utf-8 with platform line endings.
+    """
+    return write_bytes_if_changed(path, encode_text(text))
+
+def write_bytes_if_changed(path, text):
+    """ Same as write_file_if_changed for already encoded text (bytes) """
+    try:
+        if os.path.getsize(path) == len(text) and file_digest(path) == hashlib.sha1(text).hexdigest():
+            return False
+    except OSError:
+        pass
+
+    f, tmp = _open_temp(path)
+    try:
+        with f:
+            f.write(text)
+        _commit_temp(tmp, path)
+    except:
+        os.remove(tmp)
+        raise
+    return True
+
+def _join_chunks(chunks, size=65536):
+    """ Joins small chunks (jinja2 yields many short strings) to blocks of about size """
+    block = []
+    length = 0
+    for chunk in chunks:
+        block.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield u''.join(block)
+            block = []
+            length = 0
+    if block:
+        yield u''.join(block)
+
+def _copy_head(src, dst, length, blocksize=65536):
+    src.seek(0)
+    while length:
+        block = src.read(min(length, blocksize))
+        dst.write(block)
+        length -= len(block)
+
+def write_chunks_if_changed(path, chunks):
+    """ Same as write_file_if_changed for text given as chunks (template.generate()).
+
+    The chunks are compared with the file content as they come, the whole text is never
+    held in memory. Nothing is written while the content matches, once it differs the
+    matching head is copied to a temporary file and the rest is written after it.
+    """
+    try:
+        current = open(path, 'rb')
+    except IOError:
+        current = None
+    f = tmp = None
+    # bytes which matched the current content
+    matched = 0
+    try:
+        for block in _join_chunks(chunks):
+            block = encode_text(block)
+            if f is None:
+                if current is not None and current.read(len(block)) == block:
+                    matched += len(block)
+                    continue
+                f, tmp = _open_temp(path)
+                if current is not None:
+                    _copy_head(current, f, matched)
+            f.write(block)
+        if f is None:
+            if current is not None and current.read(1) == b'':
+                return False
+            # the file is longer (or does not exist)
+            f, tmp = _open_temp(path)
+            if current is not None:
+                _copy_head(current, f, matched)
+        f.close()
+        if current is not None:
+            current.close()
+            current = None
+        _commit_temp(tmp, path)
+    except:
+        if f is not None:
+            f.close()
+            os.remove(tmp)
+        raise
+    finally:
+        if current is not None:
+            current.close()
+    return True
+
+def file_digest(path, blocksize=65536):
+    """ sha1 of the file content """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _reflink_file(src, dst):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflink is not supported", dst)
+    with open(src, 'rb') as s:
+        with open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    shutil.copystat(src, dst)
+
+def materialize_file(src, dst, mode='copy'):
+    """ Create dst from src using the mode (one of COPY_MODES), copy is the fallback """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        if mode == 'hardlink':
+            os.link(src, dst)
+            return
+        elif mode == 'symlink':
+            os.symlink(os.path.abspath(src), dst)
+            return
+        elif mode == 'reflink':
+            _reflink_file(src, dst)
+            return
+    except (AttributeError, EnvironmentError, IOError):
+        # not supported by the platform or the filesystem (cross device, etc.)
+        if os.path.lexists(dst):
+            os.remove(dst)
+    shutil.copy2(src, dst)
+
+def _is_up_to_date(src, dst, mode, record, src_digest=None):
+    """ Check if dst is the same file as src, record is what was stored for dst the last time """
+    if record and record.get('mode') != mode:
+        return False
+    if mode == 'symlink' and os.path.islink(dst):
+        return os.readlink(dst) == os.path.abspath(src)
+    if not os.path.isfile(dst) or os.path.islink(dst):
+        return False
+    if mode == 'hardlink' and os.path.samefile(src, dst):
+        return True
+    s_stat = os.stat(src)
+    d_stat = os.stat(dst)
+    if s_stat.st_size != d_stat.st_size or abs(s_stat.st_mtime - d_stat.st_mtime) > 0.001:
+        return False
+    if src_digest:
+        d_digest = record.get('digest') if record else None
+        return (d_digest or file_digest(dst)) == src_digest
+    return True
+
+def sync_files(files, destination, mode='copy', checksum=False, jobs=None):
+    """ Incremental copy of files to the destination directory.
+
+    files is a list of tuples (source path, path relative to destination). Files which are
+    not changed (size, mtime and optionaly sha1) are skipped, files copied the last time
+    which are not in the list anymore are removed. The state is kept in the destination
+    directory (SYNC_STATE_FILE). Returns a tuple (copied, skipped, removed).
+    """
+    state_file = os.path.join(destination, SYNC_STATE_FILE)
+    old_state = load_json(state_file, {})
+    state = {}
+    pairs = []
+    for src, rel in files:
+        rel = os.path.normpath(rel)
+        if rel in state:
+            continue
+        state[rel] = {}
+        pairs.append((src, rel))
+
+    # directories are created upfront, makedirs from many threads race
+    for d in sorted(set(os.path.dirname(os.path.join(destination, rel)) for src, rel in pairs)):
+        if not os.path.exists(d):
+            os.makedirs(d)
+
+    def _sync_one(pair):
+        src, rel = pair
+        dst = os.path.join(destination, rel)
+        record = {'mode': mode}
+        if checksum:
+            record['digest'] = file_digest(src)
+        if _is_up_to_date(src, dst, mode, old_state.get(rel), record.get('digest')):
+            return rel, record, False
+        materialize_file(src, dst, mode)
+        return rel, record, True
+
+    pool = ThreadPool(jobs or cpu_count())
+    try:
+        results = pool.map(_sync_one, pairs)
+    finally:
+        pool.close()
+        pool.join()
+
+    copied = 0
+    for rel, record, changed in results:
+        state[rel] = record
+        copied += int(changed)
+
+    removed = 0
+    for rel in old_state:
+        if rel not in state:
+            path = os.path.join(destination, rel)
+            if os.path.lexists(path):
+                os.remove(path)
+                removed += 1
+            # prune directories which got empty
+            parent = os.path.dirname(path)
+            while parent and os.path.normpath(parent) != os.path.normpath(destination) and \
+                    os.path.isdir(parent) and not os.listdir(parent):
+                os.rmdir(parent)
+                parent = os.path.dirname(parent)
+
+    dump_json(state_file, state)
+    return copied, len(pairs) - copied, removed
+
+def makedirs(path):
+    """ os.makedirs which does not fail if another process created the directory """
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+class FileLock(object):
+    """ Advisory inter-process lock of a directory (fcntl.flock or msvcrt.locking).
+
+    Processes sharing a workspace hold the lock while they write into the directory,
+    files are replaced atomically, so readers do not need it. Usable as a context manager.
+    """
+
+    def __init__(self, directory, name=LOCK_FILE):
+        self.path = os.path.join(directory, name)
+        self.fd = None
+
+    def _try_lock(self, blocking):
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                return True
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+                    raise
+                return False
+        if msvcrt is not None:
+            while True:
+                try:
+                    # LK_LOCK gives up after 10 attempts
+                    msvcrt.locking(self.fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                    return True
+                except (IOError, OSError):
+                    if not blocking:
+                        return False
+        return True
+
+    def _is_current(self):
+        # the lock file might have been removed (clean) while this process waited for it
+        if not hasattr(os.path, 'samestat'):
+            # windows, files can't be removed while open
+            return True
+        try:
+            return os.path.samestat(os.fstat(self.fd), os.stat(self.path))
+        except OSError:
+            return False
+
+    def acquire(self):
+        while True:
+            makedirs(os.path.dirname(self.path) or '.')
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            if not self._try_lock(False):
+                logger.info("Waiting for another process to finish %s" % os.path.dirname(self.path))
+                self._try_lock(True)
+            if self._is_current():
+                return self
+            self.release()
+
+    def release(self):
+        if self.fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+def copy_portable_files(files, root):
+    """ Copy portable files (list of (source, destination) tuples) to their destination within root.
+
+    Portable files are copied once, a user might modify them afterwards. The manifest
+    in the root records the source and digest of each copied file, a destination is
+    updated only if its source changed and it was not modified since it was copied.
+    Returns the number of copied files. The root is locked while files are copied.
+    """
+    with FileLock(root):
+        return _copy_portable_files(files, root)
+
+def _copy_portable_files(files, root):
+    manifest_file = os.path.join(root, PORTABLE_MANIFEST_FILE)
+    manifest = load_json(manifest_file, {})
+    copied = 0
+    changed = False
+    for src, dst in files:
+        rel = os.path.relpath(dst, root)
+        record = manifest.get(rel)
+        s_stat = os.stat(src)
+        if os.path.exists(dst):
+            if not record or record['src'] != os.path.abspath(src):
+                # not copied by progen, keep it
+                continue
+            if record['size'] == s_stat.st_size and record['mtime'] == s_stat.st_mtime:
+                continue
+            digest = file_digest(src)
+            if digest == record['digest'] or file_digest(dst) != record['digest']:
+                # source content did not change or the destination was modified
+                record['size'], record['mtime'] = s_stat.st_size, s_stat.st_mtime
+                changed = True
+                continue
+        else:
+            digest = file_digest(src)
+            makedirs(os.path.dirname(dst))
+        shutil.copy2(src, dst)
+        manifest[rel] = {'src': os.path.abspath(src), 'digest': digest,
+                         'size': s_stat.st_size, 'mtime': s_stat.st_mtime}
+        copied += 1
+        changed = True
+    if changed:
+        dump_json(manifest_file, manifest)
+    return copied
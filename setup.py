@@ -21,10 +21,27 @@ except ImportError:
     from pip import download
     
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 
 def read(fname):
     return open(os.path.join(os.path.dirname(__file__), fname)).read()
 
+class BuildPyCompileTemplates(build_py):
+    """ Compiles jinja2 templates to python modules shipped within the package """
+
+    def run(self):
+        build_py.run(self)
+        try:
+            import jinja2
+        except ImportError:
+            self.warn("jinja2 is not available, templates are not precompiled")
+            return
+        # execute the loader module directly, the package dependencies might not be installed yet
+        loader = {'__file__': os.path.join('project_generator', 'template_loader.py')}
+        exec(read(loader['__file__']), loader)
+        loader['compile_templates'](os.path.join('project_generator', 'templates'),
+                                    os.path.join(self.build_lib, 'project_generator', 'templates_compiled'))
+
 requirements = [str(requirement.req) for requirement in parse_requirements('requirements.txt', session=download.PipSession())]
 
 setup(
@@ -54,4 +71,5 @@ setup(
 
     install_requires = requirements,
     include_package_data = True,
+    cmdclass = {'build_py': BuildPyCompileTemplates},
 )
@@ -0,0 +1,145 @@
+# Copyright 2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import shutil
+import tempfile
+import threading
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from project_generator.cache import *
+from project_generator.targets import get_target_definitions
+from project_generator.tools_supported import ToolsSupported
+
+def _write(path, data):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def test_pack():
+    root = tempfile.mkdtemp()
+    try:
+        out = os.path.join(root, 'out')
+        files = [os.path.join(out, 'Makefile'), os.path.join(out, 'src', 'main.c')]
+        for f in files:
+            _write(f, b'all:\r\n')
+        data = pack(out, files, {'path': 'out'})
+        # files outside the output directory are not cached
+        assert pack(out, files + [os.path.join(root, 'other')], {}) is None
+
+        shutil.rmtree(out)
+        restored, generated = unpack(data, out)
+        assert sorted(restored) == sorted(files)
+        assert generated == {'path': 'out'}
+        with open(files[1], 'rb') as f:
+            assert f.read() == b'all:\r\n'
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_get_key():
+    make = ToolsSupported().get_tool('make_gcc_arm')
+    cmake = ToolsSupported().get_tool('cmake_gcc_arm')
+    key = get_key('fingerprint', make)
+    assert key == get_key('fingerprint', make) and key != get_key('other', make)
+    cmake_key = get_key('fingerprint', cmake)
+    # only the working directory of exporters which write it is a part of the key
+    cwd = os.getcwd()
+    root = tempfile.mkdtemp()
+    os.chdir(root)
+    try:
+        assert get_key('fingerprint', make) == key
+        assert get_key('fingerprint', cmake) != cmake_key
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
+    # other content of the target definitions
+    definitions = get_target_definitions()
+    digest = definitions.get_digest()
+    definitions.digest = 'other'
+    try:
+        assert get_key('fingerprint', make) != key
+    finally:
+        definitions.digest = digest
+
+def test_local_cache():
+    root = tempfile.mkdtemp()
+    try:
+        cache = get_cache(root, 1)
+        assert isinstance(cache, LocalCache)
+        assert cache.get('aa11') is None
+        cache.put('aa11', b'1' * 400 * 1024)
+        cache.put('bb22', b'2' * 400 * 1024)
+        os.utime(cache._get_path('aa11'), (1, 1))
+        os.utime(cache._get_path('bb22'), (2, 2))
+        assert cache.get('aa11') == b'1' * 400 * 1024
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # the least recently used entry is removed
+        cache.put('cc33', b'3' * 400 * 1024)
+        cache.close()
+        assert cache.get('bb22') is None
+        assert cache.get('aa11') is not None and cache.get('cc33') is not None
+        assert cache.summarize() == "Cache %s: 3 hits, 2 misses" % root
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+class _CacheHandler(BaseHTTPRequestHandler):
+    entries = {}
+
+    def do_GET(self):
+        data = self.entries.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_PUT(self):
+        self.entries[self.path] = self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+def test_http_cache():
+    server = HTTPServer(('127.0.0.1', 0), _CacheHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        cache = get_cache('http://127.0.0.1:%d/progen/' % server.server_address[1])
+        assert isinstance(cache, HttpCache)
+        assert cache.get('aa11') is None
+        cache.put('aa11', b'entry')
+        assert _CacheHandler.entries == {'/progen/aa11': b'entry'}
+        assert cache.get('aa11') == b'entry'
+        assert (cache.hits, cache.misses) == (1, 1)
+    finally:
+        server.shutdown()
+        server.server_close()
+    # the server is gone, a miss
+    assert cache.get('aa11') is None
+    try:
+        get_cache('ftp://127.0.0.1/progen')
+        assert False
+    except ValueError:
+        pass
@@ -0,0 +1,155 @@
+# Copyright 2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import time
+import shutil
+import tempfile
+import threading
+
+from project_generator.manifest import *
+from project_generator.util import LOCK_FILE, FileLock
+
+def _write(path, text=''):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wt') as f:
+        f.write(text)
+
+def test_clean_outputs():
+    root = tempfile.mkdtemp()
+    try:
+        out = os.path.join(root, 'out')
+        files = [os.path.join(out, 'Makefile'), os.path.join(out, 'src', 'main.c')]
+        for f in files:
+            _write(f)
+        manifest = write_manifest(out, 'project_1', 'make_gcc_arm', files)
+        assert manifest['files'] == [LOCK_FILE, MANIFEST_FILE, 'Makefile', os.path.join('src', 'main.c')]
+        assert manifest['dirs'] == ['.', 'src']
+
+        # files not listed are kept
+        _write(os.path.join(out, 'build', 'main.o'))
+        # the lock is taken while cleaning, then removed as well
+        assert clean_outputs([out]) == 4
+        assert os.listdir(out) == ['build']
+        # nothing listed anymore
+        assert clean_outputs([out]) == 0
+
+        # files are removed once a process generating to the directory is done
+        for f in files:
+            _write(f)
+        write_manifest(out, 'project_1', 'make_gcc_arm', files)
+        results = []
+        with FileLock(out):
+            thread = threading.Thread(target=lambda: results.append(clean_outputs([out])))
+            thread.start()
+            time.sleep(0.1)
+            assert os.path.exists(files[1])
+        thread.join()
+        assert results == [4]
+        assert os.listdir(out) == ['build']
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_manifest_index():
+    root = tempfile.mkdtemp()
+    cache_dir = tempfile.mkdtemp()
+    try:
+        index = ManifestIndex(root, cache_dir)
+        index.add('project_1', 'uvision', os.path.join(root, 'out', 'project_1'), ['project_2'])
+        index.add('project_2', 'uvision', os.path.join(root, 'out', 'project_2'))
+        index.add('project_2', 'iar', os.path.join(root, 'out', 'iar_project_2'))
+        index.save()
+        # nothing is left in the source tree, the lock file is removed
+        assert os.listdir(root) == []
+        assert os.listdir(os.path.dirname(index.path)) == [os.path.basename(index.path)]
+
+        index = ManifestIndex(root, cache_dir)
+        assert index.get_output_dirs('project_3') is None
+        assert index.get_output_dirs('project_1', 'uvision') == [
+            ('project_1', 'uvision', os.path.join(root, 'out', 'project_1')),
+            ('project_2', 'uvision', os.path.join(root, 'out', 'project_2'))]
+        assert len(index.get_output_dirs()) == 3
+
+        index.remove('project_2', 'iar')
+        assert index.dirty
+        assert len(index.get_output_dirs()) == 2
+
+        # an index of cleaned outputs is removed
+        index.remove('project_1', 'uvision')
+        index.remove('project_2', 'uvision')
+        index.save()
+        assert os.listdir(os.path.dirname(index.path)) == []
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+def test_get_clean_dirs():
+    root = tempfile.mkdtemp()
+    try:
+        index = ManifestIndex(root)
+        index.add('app_1', 'uvision', os.path.join(root, 'app_1'), ['lib'])
+        index.add('app_2', 'uvision', os.path.join(root, 'app_2'), ['lib'])
+        index.add('lib', 'uvision', os.path.join(root, 'lib'), ['lib_4'])
+        index.add('lib_4', 'uvision', os.path.join(root, 'lib_4'))
+        # app_2 still requires the libraries
+        assert index.get_clean_dirs('app_1') == [('app_1', 'uvision', os.path.join(root, 'app_1'))]
+        # a project is cleaned when asked for
+        assert [name for name, tool, path in index.get_clean_dirs('lib')] == ['lib']
+        assert index.get_clean_dirs('app_3') is None
+
+        index.remove('app_1', 'uvision')
+        assert [name for name, tool, path in index.get_clean_dirs('app_2')] == ['app_2', 'lib', 'lib_4']
+        assert len(index.get_clean_dirs()) == 3
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_get_status():
+    root = tempfile.mkdtemp()
+    try:
+        files = [os.path.join(root, 'Makefile')]
+        _write(files[0])
+        assert get_status({}, root, 'abc') == 'new'
+        manifest = write_manifest(root, 'project_1', 'make_gcc_arm', files, 'abc', {'path': root})
+        assert manifest['generated'] == {'path': root}
+        assert get_status(manifest, root, 'abc') == UNCHANGED
+        assert get_status(manifest, root, 'abc', force=True) == 'forced'
+        assert get_status(manifest, root, 'def') == 'changed'
+        # sources are copied to the output directory
+        assert get_status(manifest, root, None) == 'copied'
+        os.remove(files[0])
+        assert get_status(manifest, root, 'abc') == 'missing files'
+
+        assert summarize([UNCHANGED, 'changed', UNCHANGED, 'new']) == \
+            "2 of 4 projects unchanged, skipped; generated: 1 new, 1 changed"
+        assert summarize([UNCHANGED]) == "1 of 1 projects unchanged, skipped; generated: none"
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_write_depfile():
+    cwd = os.getcwd()
+    root = tempfile.mkdtemp()
+    try:
+        os.chdir(root)
+        path = write_depfile('out', ['projects.yaml', os.path.join(root, 'my project', 'module.yaml'), 'projects.yaml'])
+        assert path == os.path.join('out', DEPFILE)
+        with open(path) as f:
+            assert f.read() == ("out/.progen.d: \\\n my\\ project/module.yaml \\\n projects.yaml\n\n"
+                                "my\\ project/module.yaml:\n\nprojects.yaml:\n")
+        # the depfile is touched, make sees it newer than its inputs
+        os.utime(path, (1, 1))
+        write_depfile('out', ['projects.yaml'])
+        assert os.path.getmtime(path) > 1
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,105 @@
+# Copyright 2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import copy
+import yaml
+import argparse
+import shutil
+import tempfile
+
+from project_generator.generate import Generator
+from project_generator.parallel import generate_parallel, estimate_cost
+from project_generator.commands import generate, build
+
+from test_project import init_files, project_1_yaml, project_2_yaml, project_3_yaml, project_4_yaml, projects_yaml
+
+def _init_workspace():
+    init_files()
+    modules = [('project_1', project_1_yaml), ('project_2', project_2_yaml),
+               ('project_3', project_3_yaml), ('project_4', project_4_yaml)]
+    for name, module in modules:
+        with open(os.path.join('test_workspace', name, 'module.yaml'), 'wt') as f:
+            f.write(yaml.dump(module, default_flow_style=False))
+    # a second root project, a copy of project_1 with more sources
+    shutil.copytree('test_workspace/project_1', 'test_workspace/project_5')
+    module = copy.deepcopy(project_1_yaml)
+    module['name'] = 'project_5'
+    module['common']['sources'] = module['common'].get('sources', []) + ['src/uv1.cpp'] * 8
+    with open('test_workspace/project_5/module.yaml', 'wt') as f:
+        f.write(yaml.dump(module, default_flow_style=False))
+    projects = copy.deepcopy(projects_yaml)
+    projects['projects']['project_5'] = projects['projects']['project_1']
+    with open('test_workspace/projects.yaml', 'wt') as f:
+        f.write(yaml.dump(projects, default_flow_style=False))
+
+def _read_tree(path):
+    files = {}
+    for root, dirs, names in os.walk(path):
+        for name in names:
+            if name.startswith('.progen'):
+                continue
+            with open(os.path.join(root, name), 'rb') as f:
+                files[os.path.relpath(os.path.join(root, name), path)] = f.read()
+    return files
+
+def test_generate_parallel():
+    cwd = os.getcwd()
+    root = tempfile.mkdtemp()
+    try:
+        os.chdir(root)
+        _init_workspace()
+        source = 'test_workspace/projects.yaml'
+        generator = Generator(source)
+        assert estimate_cost(generator, 'project_5') > estimate_cost(generator, 'project_1')
+        assert estimate_cost(generator, 'project_6') == 0
+
+        for project in generator.generate('', 'make_gcc_arm'):
+            assert project.generate() == 0
+        shutil.move('projects', 'sequential')
+
+        assert generate_parallel(source, ['project_1', 'project_5'], 'make_gcc_arm', 2) == 0
+        assert _read_tree('projects') == _read_tree('sequential')
+        index = Generator(source).index
+        assert sorted(name for name, tool, path in index.get_output_dirs()) == ['project_1', 'project_2', 'project_5']
+
+        # a project which fails doesn't stop the others
+        shutil.rmtree('projects')
+        assert generate_parallel(source, ['project_1', 'project_6'], 'make_gcc_arm', 2) == -1
+        assert os.path.isdir('projects/make_gcc_arm/project_1')
+        assert generate_parallel(source, [], 'make_gcc_arm') == -1
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_jobs_arguments():
+    cwd = os.getcwd()
+    root = tempfile.mkdtemp()
+    try:
+        os.chdir(root)
+        _init_workspace()
+        for command in [generate, build]:
+            parser = argparse.ArgumentParser()
+            command.setup(parser)
+            try:
+                parser.parse_args(['-f', 'test_workspace/projects.yaml', '-j', '-1'])
+                assert False
+            except SystemExit:
+                pass
+            # a project is not split among workers
+            args = parser.parse_args(['-f', 'test_workspace/projects.yaml', '-p', 'project_1', '-j', '2'])
+            assert command.run(args) == -1
+        assert not os.path.exists('projects')
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
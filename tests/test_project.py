@@ -12,14 +12,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import os
+import copy
 import shutil
+import logging
+import subprocess
+import sys
+import threading
+import traceback
 
 import yaml
 from unittest import TestCase
 
 from project_generator.project import Project
 from project_generator.generate import Generator
+from project_generator.pipeline import generate_pipeline
+from project_generator.cache import LocalCache
 from project_generator.settings import ProjectSettings
+from project_generator.sinks import MemorySink
+from project_generator.targets import get_target_definitions
+from project_generator.tools_supported import ToolsSupported
+from project_generator.tools.coide import CoIDEdefinitions
+from project_generator.tools.tool import OptionIndex
 from project_generator.util import merge_recursive
 
 project_1_yaml = {
@@ -220,6 +233,33 @@ def init_files():
         with open(os.path.join(os.getcwd(), cfile), 'wt') as f:
             pass
 
+# uvision device of the target
+target_option = {
+    'Device': ['LPC1768'], 'DeviceId': ['0'], 'Vendor': ['NXP'], 'Debugger': {'Name': 'cmsis-dap'},
+    'Cpu': ['IRAM(0x10000000,0x8000) IROM(0x00000000,0x80000) CPUTYPE("Cortex-M3")'],
+    'FlashDriverDll': ['UL2CM3(-S0 -C0 -P0)'], 'SFDFile': ['LPC176x5x.svd'], 'RegisterFile': ['LPC17xx.h'],
+}
+
+def get_target_project(tool):
+    """ project_1 with the export data filled, with a target for tools which need one """
+    project = next(Generator('test_workspace/projects.yaml').generate('project_1', tool))
+    project._fill_export_dict()
+    project.export['target'] = 'mbed-lpc1768'
+    project.export['debugger'] = 'cmsis-dap'
+    project.export['TargetOption'] = copy.deepcopy(target_option)
+    # uvision doesn't accept common flags
+    flags = project.export['flags']
+    flags['c'], flags['common'] = flags['common'] + flags['c'], []
+    return project
+
+def export_project(project, exporter=None):
+    """ Files exported for the project, in memory """
+    exporter = exporter or ToolsSupported().get_tool(project.tool)(project.export, project.settings)
+    exporter.sink = MemorySink()
+    exporter.outputs = []
+    exporter.export_project()
+    return exporter.sink.files
+
 def test_output_directory_formatting():
     path, depth = Project._generate_output_dir(ProjectSettings(),'aaa/bbb/cccc/ddd/eee/ffff/ggg')
 
@@ -288,3 +328,261 @@ class TestProjectYAML(TestCase):
     def test_set_output_dir_path(self):
         self.project._fill_export_dict('uvision')
         assert self.project.export['output_dir']['path'] == os.path.join('projects', 'uvision','project_1')
+
+    def test_render(self):
+        # nothing is written, generated files are returned
+        files = Generator('test_workspace/projects.yaml').render('project_1', 'gcc_arm')
+        assert sorted(files.keys()) == [
+            'projects/gcc_arm/project_1/Makefile', 'projects/gcc_arm/project_2/Makefile']
+        assert b'project_1' in files['projects/gcc_arm/project_1/Makefile']
+        assert not os.path.exists('projects')
+
+        # the default tool of settings, no debug dump written either
+        generator = Generator('test_workspace/projects.yaml')
+        generator.settings.DEFAULT_TOOL = 'gcc_arm'
+        logger = logging.getLogger('progen.project')
+        level = logger.level
+        logger.setLevel(logging.DEBUG)
+        try:
+            assert generator.render('project_1') == files
+        finally:
+            logger.setLevel(level)
+        assert not os.path.exists('project_1.log')
+
+    def test_render_hash_seed(self):
+        # the same input gives byte identical output, whatever the dict ordering is
+        script = ("import hashlib, json; from project_generator.generate import Generator; "
+                  "from test_project import get_target_project, export_project; "
+                  "files = {}; [files.update(Generator('test_workspace/projects.yaml').render('project_1', tool)) "
+                  "for tool in ['gcc_arm', 'gnu_mcu_eclipse', 'visual_studio_make_gcc_arm']]; "
+                  "[files.update(export_project(get_target_project(tool))) for tool in ['uvision', 'iar_arm']]; "
+                  "print(json.dumps(dict((k, hashlib.sha1(v).hexdigest()) for k, v in files.items()), sort_keys=True))")
+        tests_dir = os.path.dirname(os.path.abspath(__file__))
+        outputs = []
+        for seed in ['1', '2', '3']:
+            env = dict(os.environ, PYTHONHASHSEED=seed,
+                       PYTHONPATH=os.pathsep.join([os.path.dirname(tests_dir), tests_dir] + sys.path))
+            outputs.append(subprocess.check_output([sys.executable, '-c', script], env=env))
+        assert outputs[0] == outputs[1] == outputs[2]
+        for name in [b'project_1.vcxproj.filters', b'project_1.uvprojx', b'project_1.ewp', b'project_1.ewd']:
+            assert name in outputs[0]
+
+    def test_render_tools(self):
+        # one generator for many tools, module files are parsed once
+        generator = Generator('test_workspace/projects.yaml')
+        projects = list(generator.generate('project_1', ['gcc_arm', 'gnu_mcu_eclipse']))
+        assert [(p.name, p.tool) for p in projects] == [
+            ('project_1', 'gcc_arm'), ('project_2', 'gcc_arm'),
+            ('project_1', 'gnu_mcu_eclipse'), ('project_2', 'gnu_mcu_eclipse')]
+        assert len(generator.modules) == 4
+        files = Generator('test_workspace/projects.yaml').render('project_1', ['gcc_arm', 'gnu_mcu_eclipse'])
+        for tool in ['gcc_arm', 'gnu_mcu_eclipse']:
+            for path, data in Generator('test_workspace/projects.yaml').render('project_1', tool).items():
+                assert files[path] == data
+
+    def test_export_threads(self):
+        # exporters don't modify the project data nor shared defaults, many threads
+        # can export the same project
+        tools = ['gcc_arm', 'make_armcc', 'sublime_make_gcc_arm', 'gnu_mcu_eclipse', 'cmake_gcc_arm',
+                 'eclipse_make_gcc_arm', 'visual_studio_make_gcc_arm', 'arm_none_eabi_gdb',
+                 'coide', 'iar_arm', 'uvision']
+        projects = dict((tool, get_target_project(tool)) for tool in tools)
+        exports = dict((tool, copy.deepcopy(project.export)) for tool, project in projects.items())
+        coproj_file = copy.deepcopy(CoIDEdefinitions.coproj_file)
+
+        def export(tool, exporter=None):
+            return export_project(projects[tool], exporter)
+
+        expected = dict((tool, export(tool)) for tool in tools)
+        results = []
+        errors = []
+        def worker():
+            try:
+                for i in range(5):
+                    for tool in tools:
+                        results.append((tool, export(tool)))
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=worker) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert len(results) == 8 * 5 * len(tools)
+        for tool, files in results:
+            assert files == expected[tool]
+        for tool in tools:
+            assert projects[tool].export == exports[tool]
+        assert CoIDEdefinitions.coproj_file == coproj_file
+
+        # an exporter can be run again
+        exporter = ToolsSupported().get_tool('gnu_mcu_eclipse')(projects['gnu_mcu_eclipse'].export, projects['gnu_mcu_eclipse'].settings)
+        assert export('gnu_mcu_eclipse', exporter) == export('gnu_mcu_eclipse', exporter) == expected['gnu_mcu_eclipse']
+
+    def test_iar_options(self):
+        project = get_target_project('iar_arm')
+        project.export['misc'] = {'c_flags': ['--c_flag']}
+        assert b'--c_flag' in export_project(project)['projects/iar_arm/project_1/project_1.ewp']
+
+        # flags need their options in the template
+        exporter = ToolsSupported().get_tool('iar_arm')(project.export, project.settings)
+        options = OptionIndex([{'name': 'IExtraOptionsCheck', 'state': '0'}])
+        exporter._ewp_flags_set(options, {}, 'c_flags', exporter.FLAG_TO_IAR['c_flags'])
+        with self.assertRaises(RuntimeError):
+            exporter._ewp_flags_set(options, project.export, 'c_flags', exporter.FLAG_TO_IAR['c_flags'])
+        assert options['IExtraOptionsCheck']['state'] == '0'
+
+    def test_generate_pipeline(self):
+        # the same files as generated one project after another
+        tools = ['gcc_arm', 'gnu_mcu_eclipse']
+        for project in Generator('test_workspace/projects.yaml').generate('project_1', tools):
+            assert project.generate() == 0
+        expected = {}
+        for root, dirs, files in os.walk('projects'):
+            for name in files:
+                with open(os.path.join(root, name), 'rb') as f:
+                    expected[os.path.join(root, name)] = f.read()
+        shutil.rmtree('projects')
+
+        results = generate_pipeline(Generator('test_workspace/projects.yaml').generate('project_1', tools))
+        assert [(p.name, p.tool, result) for p, result in results] == [
+            ('project_1', 'gcc_arm', 0), ('project_2', 'gcc_arm', 0),
+            ('project_1', 'gnu_mcu_eclipse', 0), ('project_2', 'gnu_mcu_eclipse', 0)]
+        for path, data in expected.items():
+            with open(path, 'rb') as f:
+                assert f.read() == data
+        shutil.rmtree('projects')
+
+        # a stage failed, raised with its traceback
+        try:
+            generate_pipeline(Generator('test_workspace/projects.yaml').generate('project_1', 'iar_arm'))
+            assert False
+        except KeyError:
+            assert os.path.basename(traceback.extract_tb(sys.exc_info()[2])[-1][0]).startswith('iar.py')
+
+    def test_generate_matrix(self):
+        generator = Generator('test_workspace/projects.yaml')
+        # combinations generated to the same directory
+        with self.assertRaises(NameError):
+            generator.generate_matrix('project_1', 'gcc_arm', [('dim_1', ['favor_1_1', 'favor_1_2'])])
+
+        generator.settings.update({'export_dir': ['projects/{tool}/{project_name}_{dim_1}_{dim_2}']})
+        matrix = [('dim_1', ['favor_1_1', 'favor_1_2']), ('dim_2', ['favor_2_1', 'favor_2_2'])]
+        projects = [p for p in generator.generate_matrix('project_1', 'gcc_arm', matrix) if p.name == 'project_1']
+        assert [p.favors for p in projects] == [
+            {'dim_1': 'favor_1_1', 'dim_2': 'favor_2_1'}, {'dim_1': 'favor_1_1', 'dim_2': 'favor_2_2'},
+            {'dim_1': 'favor_1_2', 'dim_2': 'favor_2_1'}, {'dim_1': 'favor_1_2', 'dim_2': 'favor_2_2'}]
+        assert [os.path.basename(p.outdir_path) for p in projects] == [
+            'project_1_favor_1_1_favor_2_1', 'project_1_favor_1_1_favor_2_2',
+            'project_1_favor_1_2_favor_2_1', 'project_1_favor_1_2_favor_2_2']
+        # favor properties select the sources
+        assert [p.project['files']['sources']['default'][-1] for p in projects] == [
+            '../project_3/sources/1_1/2_1_favors.c', '../project_3/sources/1_1/2_2_favors.c',
+            '../project_3/sources/1_2/2_1_favors.c', '../project_3/sources/1_2/2_2_favors.c']
+
+    def test_generate_unchanged(self):
+        def generate(**options):
+            projects = list(Generator('test_workspace/projects.yaml').generate('project_1', 'gcc_arm'))
+            for project in projects:
+                assert project.generate(**options) == 0
+            return projects
+
+        projects = generate()
+        assert [p.status for p in projects] == ['new', 'new']
+        makefile = 'projects/gcc_arm/project_1/Makefile'
+        os.utime(makefile, (0, 0))
+        # the exporter is skipped, files it generated are known for the build
+        skipped = generate()
+        assert [p.status for p in skipped] == ['unchanged', 'unchanged']
+        assert skipped[0].generated_files == projects[0].generated_files
+        assert os.path.getmtime(makefile) == 0
+        assert [p.status for p in generate(force=True)] == ['forced', 'forced']
+        # other target definitions installed
+        definitions = get_target_definitions()
+        stamp = definitions.stamp
+        definitions.stamp = 'other'
+        try:
+            assert [p.status for p in generate()] == ['changed', 'changed']
+        finally:
+            definitions.stamp = stamp
+        assert [p.status for p in generate()] == ['changed', 'changed']
+
+        # sources of project_1 changed, project_2 doesn't inherit them
+        project = copy.deepcopy(project_1_yaml)
+        project['files']['sources']['sources_dict'].append('src/uv1.cpp')
+        with open('test_workspace/project_1/module.yaml', 'wt') as f:
+            f.write(yaml.dump(project, default_flow_style=False))
+        assert [p.status for p in generate()] == ['changed', 'unchanged']
+        with open(makefile) as f:
+            assert 'uv1.cpp' in f.read()
+        os.remove(makefile)
+        assert [p.status for p in generate()] == ['missing files', 'unchanged']
+        assert [p.status for p in generate(copied=True, copy=True)] == ['copied', 'copied']
+        shutil.rmtree('projects')
+
+    def test_generate_failed(self):
+        # iar needs a target, the export fails and leaves no output behind
+        project = next(Generator('test_workspace/projects.yaml').generate('project_1', 'iar_arm'))
+        self.assertRaises(KeyError, project.generate)
+        assert not os.path.exists('projects')
+        # an existing directory is kept, without the files of the export
+        os.makedirs('projects/iar_arm/project_1')
+        self.assertRaises(KeyError, project.generate)
+        assert os.listdir('projects/iar_arm/project_1') == []
+
+        # sources copied before are unchanged, they are kept as well as other files
+        for gcc_project in Generator('test_workspace/projects.yaml').generate('project_1', 'gcc_arm'):
+            assert gcc_project.generate(copied=True, copy=True) == 0
+        shutil.rmtree('projects/iar_arm')
+        shutil.move('projects/gcc_arm/project_1', 'projects/iar_arm/project_1')
+        for name in ['Makefile', '.progen_manifest.json', '.progen.d', '.progen.lock']:
+            os.remove(os.path.join('projects/iar_arm/project_1', name))
+        with open('projects/iar_arm/project_1/notes.txt', 'wt') as f:
+            f.write('notes')
+        source = 'projects/iar_arm/project_1/test_workspace/project_1/src/main.cpp'
+        inode = os.stat(source).st_ino
+        project = next(Generator('test_workspace/projects.yaml').generate('project_1', 'iar_arm'))
+        self.assertRaises(KeyError, project.generate, copied=True, copy=True)
+        assert os.stat(source).st_ino == inode
+        assert os.path.exists('projects/iar_arm/project_1/notes.txt')
+        assert not os.path.exists('projects/iar_arm/project_1/.progen.lock')
+        shutil.rmtree('projects')
+
+    def test_generate_cached(self):
+        cache = LocalCache(os.path.join(os.getcwd(), 'test_workspace', 'cache'))
+        for project in Generator('test_workspace/projects.yaml').generate('project_1', 'gcc_arm'):
+            assert project.generate(cache=cache) == 0
+        with open('projects/gcc_arm/project_1/Makefile', 'rb') as f:
+            expected = f.read()
+        assert (cache.hits, cache.misses) == (0, 2)
+
+        # files are restored, the exporter is not run
+        shutil.rmtree('projects')
+        projects = list(Generator('test_workspace/projects.yaml').generate('project_1', 'gcc_arm'))
+        for project in projects:
+            assert project.generate(cache=cache) == 0
+        assert (cache.hits, cache.misses) == (2, 2)
+        assert projects[0].generated_files['gcc_arm']['files']['makefile'] == 'projects/gcc_arm/project_1/Makefile'
+        with open('projects/gcc_arm/project_1/Makefile', 'rb') as f:
+            assert f.read() == expected
+        shutil.rmtree('projects')
+
+    def test_generate_depfile(self):
+        # a directory of includes is listed
+        project = copy.deepcopy(project_1_yaml)
+        project['files']['includes'].append('src')
+        with open('test_workspace/project_1/module.yaml', 'wt') as f:
+            f.write(yaml.dump(project, default_flow_style=False))
+        projects = list(Generator('test_workspace/projects.yaml').generate('project_1', 'gcc_arm'))
+        for project in projects:
+            assert project.generate() == 0
+        inputs = ['test_workspace/projects.yaml'] + ['test_workspace/project_%d/module.yaml' % i for i in range(1, 5)]
+        assert projects[0].get_inputs() == set(inputs + ['test_workspace/project_1/src'])
+        # project_2 doesn't list the directory, it inherits from project_1 still
+        assert projects[1].get_inputs() == set(inputs)
+        with open('projects/gcc_arm/project_1/.progen.d') as f:
+            assert f.readline() == 'projects/gcc_arm/project_1/.progen.d: \\\n'
+            assert ' test_workspace/project_1/src \\\n' in f.readlines()
+        shutil.rmtree('projects')
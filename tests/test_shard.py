@@ -0,0 +1,93 @@
+# Copyright 2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import copy
+import yaml
+import shutil
+import tempfile
+
+from project_generator.generate import Generator
+from project_generator.shard import partition, get_shard
+
+from test_project import init_files, project_1_yaml, project_2_yaml, project_3_yaml, project_4_yaml, projects_yaml
+
+def test_partition():
+    closures = {
+        'a': set(['a', 'lib_1']),
+        'b': set(['b', 'lib_1', 'lib_2']),
+        'c': set(['c', 'lib_2']),
+        'd': set(['d']),
+        'e': set(['e']),
+        'f': set(['f']),
+    }
+    costs = {'a': 1, 'b': 1, 'c': 1, 'lib_1': 2, 'lib_2': 2, 'd': 4, 'e': 3, 'f': 1}
+    # a, b and c share libraries, one shard generates them
+    assert partition(closures, costs, 2) == [['a', 'b', 'c', 'f'], ['d', 'e']]
+    assert partition(closures, costs, 3) == [['a', 'b', 'c'], ['d'], ['e', 'f']]
+    # shards might be empty, all roots are in one of them
+    shards = partition(closures, costs, 8)
+    assert sorted(sum(shards, [])) == sorted(closures.keys())
+    assert shards[4:] == [[], [], [], []]
+
+def _write_module(name, module):
+    with open(os.path.join('test_workspace', name, 'module.yaml'), 'wt') as f:
+        f.write(yaml.dump(module, default_flow_style=False))
+
+def test_get_shard():
+    cwd = os.getcwd()
+    root = tempfile.mkdtemp()
+    try:
+        os.chdir(root)
+        init_files()
+        modules = [('project_1', project_1_yaml), ('project_2', project_2_yaml),
+                   ('project_3', project_3_yaml), ('project_4', project_4_yaml)]
+        for name, module in modules:
+            _write_module(name, module)
+        projects = copy.deepcopy(projects_yaml)
+        # project_5 shares project_2 with project_1, project_6 and project_7 require only sources
+        for name, required in [('project_5', ['project_2', 'project_3']), ('project_6', ['project_3']),
+                               ('project_7', ['project_3'])]:
+            shutil.copytree('test_workspace/project_1', os.path.join('test_workspace', name))
+            module = copy.deepcopy(project_1_yaml)
+            module['name'] = name
+            module['required'] = dict((r, {}) for r in required)
+            _write_module(name, module)
+            projects['projects'][name] = projects['projects']['project_1']
+        with open('test_workspace/projects.yaml', 'wt') as f:
+            f.write(yaml.dump(projects, default_flow_style=False))
+
+        generator = Generator('test_workspace/projects.yaml')
+        shards = [get_shard(generator, 'gcc_arm', i, 2) for i in [1, 2]]
+        assert shards == [['project_1', 'project_5'], ['project_6', 'project_7']]
+
+        # durations of the local index differ between machines, they are not used
+        for name, duration in [('project_1', 0.1), ('project_2', 0.1), ('project_5', 0.1), ('project_6', 10),
+                               ('project_7', 1)]:
+            generator.index.add(name, 'gcc_arm', 'out', duration=duration)
+        generator.save_index()
+        assert get_shard(generator, 'gcc_arm', 1, 2) == ['project_1', 'project_5']
+
+        # durations of a shared file are used once all projects have one
+        durations = 'test_workspace/durations.json'
+        shutil.copy(generator.index.path, durations)
+        assert get_shard(generator, 'gcc_arm', 1, 2, durations) == ['project_6']
+        assert get_shard(generator, 'gcc_arm', 2, 2, durations) == ['project_1', 'project_5', 'project_7']
+        generator.index.remove('project_7', 'gcc_arm')
+        generator.save_index()
+        assert get_shard(generator, 'gcc_arm', 1, 2, generator.index.path) == \
+            ['project_1', 'project_5']
+        assert get_shard(generator, 'gcc_arm', 1, 2, 'test_workspace/missing.json') == ['project_1', 'project_5']
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
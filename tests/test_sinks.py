@@ -0,0 +1,50 @@
+# Copyright 2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import shutil
+import tarfile
+import zipfile
+import tempfile
+
+from project_generator.sinks import *
+
+def test_archive_sink():
+    root = tempfile.mkdtemp()
+    try:
+        source = os.path.join(root, 'main.c')
+        with open(source, 'wt') as f:
+            f.write('int main() {}')
+        for name in ['out.zip', 'out.tar.gz']:
+            sink = ArchiveSink(os.path.join(root, name), root)
+            sink.write(os.path.join(root, 'projects', 'Makefile'), u'all:\n')
+            sink.copy_files([(source, 'src/main.c')], os.path.join(root, 'projects'))
+            sink.close()
+        # nothing is written outside the archives
+        assert not os.path.exists(os.path.join(root, 'projects'))
+
+        with zipfile.ZipFile(os.path.join(root, 'out.zip')) as archive:
+            assert sorted(archive.namelist()) == ['projects/Makefile', 'projects/src/main.c']
+            assert archive.read('projects/src/main.c') == b'int main() {}'
+        with tarfile.open(os.path.join(root, 'out.tar.gz')) as archive:
+            assert sorted(archive.getnames()) == ['projects/Makefile', 'projects/src/main.c']
+            assert archive.extractfile('projects/Makefile').read() == os.linesep.join(['all:', '']).encode('ascii')
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_archive_sink_format():
+    try:
+        ArchiveSink('out.rar')
+        assert False
+    except ValueError:
+        pass
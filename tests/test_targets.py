@@ -0,0 +1,52 @@
+# Copyright 2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import shutil
+import tempfile
+
+from project_generator.targets import *
+
+def test_target_definitions():
+    root = tempfile.mkdtemp()
+    try:
+        definitions = TargetDefinitions(root)
+        assert 'frdm-k64f' in definitions.get_targets()
+        assert definitions.is_supported('frdm-k64f')
+        assert definitions.is_supported('frdm-k64f', 'iar')
+        assert not definitions.is_supported('frdm-k64f', 'unknown_tool')
+        assert not definitions.is_supported('unknown_target')
+        assert definitions.get_tool_definition('unknown_target', 'iar') is None
+
+        # each caller gets a copy
+        definition = definitions.get_tool_definition('frdm-k64f', 'iar')
+        definition['OGCoreOrChip']['state'] = None
+        assert definitions.get_tool_definition('frdm-k64f', 'iar') != definition
+
+        # the index is written once, by flush
+        definitions.get_tool_definition('arch-pro', 'iar')
+        assert not os.path.exists(os.path.join(root, INDEX_FILE))
+        definitions.flush()
+        assert os.path.exists(os.path.join(root, INDEX_FILE))
+        parsed = definitions.get_tool_definition('frdm-k64f', 'iar')
+
+        # records are loaded from the index, the same as parsed
+        definitions = TargetDefinitions(root)
+        definitions.progendef.mcus.get_mcu_record = None
+        definitions.progendef.targets.get_mcu_record = None
+        loaded = definitions.get_tool_definition('frdm-k64f', 'iar')
+        assert loaded['OGCoreOrChip']['state'] == [1]
+        assert loaded == parsed and repr(loaded) == repr(parsed)
+        assert definitions.get_tool_definition('arch-pro', 'iar') is not None
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,45 @@
+# Copyright 2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import shutil
+import tempfile
+
+from jinja2 import Environment
+
+from project_generator.template_loader import *
+
+def test_precompiled_loader():
+    root = tempfile.mkdtemp()
+    try:
+        templates = os.path.join(root, 'templates')
+        compiled = os.path.join(root, 'compiled')
+        os.makedirs(templates)
+        with open(os.path.join(templates, 'base.tmpl'), 'wt') as f:
+            f.write('name: {% block name %}{% endblock %}')
+        with open(os.path.join(templates, 'project.tmpl'), 'wt') as f:
+            f.write('{% extends "base.tmpl" %}{% block name %}{{ name }}{% endblock %}')
+        compile_templates(templates, compiled)
+
+        env = Environment(loader=PrecompiledLoader(templates, compiled))
+        # compiled modules are used, no template is compiled
+        env.compile = None
+        assert env.get_template('project.tmpl').render(name='progen') == 'name: progen'
+
+        # modified template is loaded from its source
+        with open(os.path.join(templates, 'base.tmpl'), 'wt') as f:
+            f.write('project: {% block name %}{% endblock %}')
+        env = Environment(loader=PrecompiledLoader(templates, compiled))
+        assert env.get_template('project.tmpl').render(name='progen') == 'project: progen'
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
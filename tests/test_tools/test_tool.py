@@ -0,0 +1,89 @@
+# Copyright 2015 0xc0170
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import shutil
+import tempfile
+
+from collections import OrderedDict
+
+import xmltodict
+
+from project_generator.tools.tool import parse_xml, unparse_xml, OptionIndex, TEMPLATE_DIR
+
+def test_parse_xml():
+    root = tempfile.mkdtemp()
+    try:
+        path = os.path.join(root, 'project.xml')
+        with open(path, 'wt') as f:
+            f.write('<project><name>a</name><file>x.c</file><file>y.c</file></project>')
+        tree = parse_xml(path)
+        assert tree == {'project': {'name': 'a', 'file': ['x.c', 'y.c']}}
+        assert isinstance(tree['project'], OrderedDict)
+        assert isinstance(parse_xml(path, dict_constructor=dict)['project'], dict)
+
+        # each call gets its own copy
+        tree['project']['file'].append('z.c')
+        assert parse_xml(path)['project']['file'] == ['x.c', 'y.c']
+
+        # modified file is parsed again
+        with open(path, 'wt') as f:
+            f.write('<project><name>bb</name></project>')
+        assert parse_xml(path) == {'project': {'name': 'bb'}}
+
+        # content of skipped elements is not loaded, the elements keep their position
+        with open(path, 'wt') as f:
+            f.write('<project><group><file>x.c</file></group><name>a</name><group><file>y.c</file></group></project>')
+        assert parse_xml(path, skip=[('project', 'group')]) == {'project': {'group': [None, None], 'name': 'a'}}
+        assert list(parse_xml(path, skip=[('project', 'group', 'file')])['project'].keys()) == ['group', 'name']
+
+        try:
+            parse_xml(os.path.join(root, 'missing.xml'))
+            assert False
+        except IOError:
+            pass
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_unparse_xml():
+    tree = OrderedDict([('project', OrderedDict([
+        ('@name', u'a"b\n'), ('@version', 2), ('empty', None), ('flag', True), ('number', 3),
+        ('file', [u'x.c', {'#text': u'<y>.c', '@type': u'c'}, {'group': [], 'name': u'\u010d\u20ac'}]),
+        ('#text', u'text'),
+    ]))])
+    for template in ['iar.ewp', 'uvision.uvproj']:
+        for kwargs in [{}, {'pretty': True}, {'encoding': 'iso-8859-1', 'pretty': True, 'indent': '  '}]:
+            for xml in [tree, parse_xml(os.path.join(TEMPLATE_DIR, template))]:
+                assert u''.join(unparse_xml(xml, blocksize=128, **kwargs)) == xmltodict.unparse(xml, **kwargs)
+
+def test_option_index():
+    settings = [
+        {'name': 'General', 'data': {'option': [{'name': 'ExePath', 'state': None}, {'name': 'ObjPath', 'state': None}]}},
+        {'name': 'ICCARM', 'data': {'option': []}},
+        {'name': 'General', 'data': {'option': []}},
+    ]
+    index = OptionIndex(settings)
+    assert 'ICCARM' in index and 'AARM' not in index
+    # the first node wins
+    assert index.index('General') == 0
+    assert index.get('AARM') is None
+
+    general = index.nested('General', 'data', 'option')
+    assert general is index.nested('General', 'data', 'option')
+    general.set('ObjPath', 'build/Obj')
+    assert settings[0]['data']['option'][1]['state'] == 'build/Obj'
+    general.append({'name': 'GFPUDeviceSlave', 'state': 'chip'})
+    assert general['GFPUDeviceSlave'] is settings[0]['data']['option'][2]
+
+    options = [{'@name': 'a', '@value': '0'}, {'@name': 'b', '@value': '1'}]
+    assert OptionIndex(options, '@name')['b']['@value'] == '1'
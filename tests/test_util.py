@@ -11,6 +11,12 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import os
+import shutil
+import tempfile
+import threading
+import time
+
 from project_generator.util import *
 
 def test_flatten():
@@ -22,3 +28,149 @@ def test_flatten():
 def test_uniqify():
     l1 = ['a', 'b', 'b', 'c', 'b', 'd', 'c', 'e', 'f', 'a']
     assert uniqify(l1) == ['a', 'b', 'c', 'd', 'e', 'f']
+
+def _write(path, text):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wt') as f:
+        f.write(text)
+
+def test_sync_files():
+    root = tempfile.mkdtemp()
+    try:
+        src = os.path.join(root, 'src')
+        dst = os.path.join(root, 'dst')
+        _write(os.path.join(src, 'main.c'), 'int main() {}')
+        _write(os.path.join(src, 'inc', 'main.h'), '#define MAIN')
+        files = [(os.path.join(src, 'main.c'), 'main.c'), (os.path.join(src, 'inc', 'main.h'), 'inc/main.h')]
+
+        assert sync_files(files, dst) == (2, 0, 0)
+        assert open(os.path.join(dst, 'inc', 'main.h')).read() == '#define MAIN'
+        # nothing changed, nothing copied
+        assert sync_files(files, dst, checksum=True) == (0, 2, 0)
+
+        # removed from the list, removed from the destination
+        assert sync_files(files[:1], dst, checksum=True) == (0, 1, 1)
+        assert not os.path.exists(os.path.join(dst, 'inc'))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_sync_files_hardlink():
+    root = tempfile.mkdtemp()
+    try:
+        src = os.path.join(root, 'src', 'main.c')
+        dst = os.path.join(root, 'dst')
+        _write(src, 'int main() {}')
+
+        assert sync_files([(src, 'main.c')], dst, mode='hardlink') == (1, 0, 0)
+        assert os.path.samefile(src, os.path.join(dst, 'main.c'))
+        assert sync_files([(src, 'main.c')], dst, mode='hardlink') == (0, 1, 0)
+        # mode changed, file is materialized again
+        assert sync_files([(src, 'main.c')], dst, mode='copy') == (1, 0, 0)
+        assert not os.path.samefile(src, os.path.join(dst, 'main.c'))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_copy_portable_files():
+    root = tempfile.mkdtemp()
+    try:
+        src = os.path.join(root, 'module', 'config.config')
+        dst = os.path.join(root, 'portable', 'include', 'config.h')
+        _write(src, '#define A 1')
+
+        assert copy_portable_files([(src, dst)], os.path.join(root, 'portable')) == 1
+        assert copy_portable_files([(src, dst)], os.path.join(root, 'portable')) == 0
+
+        # source changed, not modified destination is updated
+        _write(src, '#define A 2')
+        os.utime(src, (0, 0))
+        assert copy_portable_files([(src, dst)], os.path.join(root, 'portable')) == 1
+        assert open(dst).read() == '#define A 2'
+
+        # destination modified by a user is kept
+        _write(dst, '#define A 3')
+        _write(src, '#define A 4')
+        os.utime(src, (1, 1))
+        assert copy_portable_files([(src, dst)], os.path.join(root, 'portable')) == 0
+        assert open(dst).read() == '#define A 3'
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_write_file_if_changed():
+    root = tempfile.mkdtemp()
+    try:
+        path = os.path.join(root, 'out', 'Makefile')
+        assert write_file_if_changed(path, u'all:\n')
+        os.utime(path, (1, 1))
+        # same content, file is not touched
+        assert not write_file_if_changed(path, u'all:\n')
+        assert os.path.getmtime(path) == 1
+        assert write_file_if_changed(path, u'all: main\n')
+        assert open(path).read() == 'all: main\n'
+        assert os.listdir(os.path.dirname(path)) == ['Makefile']
+
+        if os.name == 'posix':
+            # new files follow the umask, existing files keep their permissions
+            umask = os.umask(0o027)
+            try:
+                assert write_file_if_changed(os.path.join(root, 'out', 'new.mk'), u'all:\n')
+            finally:
+                os.umask(umask)
+            assert os.stat(os.path.join(root, 'out', 'new.mk')).st_mode & 0o777 == 0o640
+            os.chmod(path, 0o600)
+            assert write_file_if_changed(path, u'all: test\n')
+            assert os.stat(path).st_mode & 0o777 == 0o600
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_write_chunks_if_changed():
+    root = tempfile.mkdtemp()
+    try:
+        path = os.path.join(root, 'out', 'Makefile')
+        assert write_chunks_if_changed(path, [u'all: ', u'main\n'])
+        os.utime(path, (1, 1))
+        # same content split differently
+        assert not write_chunks_if_changed(path, iter([u'all', u': main', u'\n']))
+        assert os.path.getmtime(path) == 1
+        # shorter, longer and different content
+        for text in [u'all:', u'all: main\n\nclean:\n', u'all: test\n', u'']:
+            assert write_chunks_if_changed(path, [text[:3], text[3:]])
+            assert open(path).read() == text
+        assert os.listdir(os.path.dirname(path)) == ['Makefile']
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_file_lock():
+    root = tempfile.mkdtemp()
+    try:
+        events = []
+        def locked():
+            with FileLock(root):
+                events.append('second')
+        with FileLock(root):
+            thread = threading.Thread(target=locked)
+            thread.start()
+            time.sleep(0.1)
+            events.append('first')
+        thread.join()
+        assert events == ['first', 'second']
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_file_lock_removed():
+    root = tempfile.mkdtemp()
+    try:
+        locks = []
+        def locked():
+            with FileLock(root) as lock:
+                locks.append(os.path.samestat(os.fstat(lock.fd), os.stat(lock.path)))
+        with FileLock(root) as lock:
+            thread = threading.Thread(target=locked)
+            thread.start()
+            time.sleep(0.1)
+            # clean removes the lock file, the waiting thread locks a new one
+            os.remove(lock.path)
+        thread.join()
+        assert locks == [True]
+    finally:
+        shutil.rmtree(root, ignore_errors=True)